@@ -22,6 +22,64 @@ class Settings:
     ADMIN_IDS: list[int] = [
         int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x.isdigit()
     ]
+    # Исходящие сообщения: параллельность и лимиты Telegram (~30 сообщений/сек, 1 сообщение/сек в чат)
+    DISPATCH_CONCURRENCY: int = int(os.getenv("DISPATCH_CONCURRENCY", "20"))
+    DISPATCH_RATE_PER_SEC: float = float(os.getenv("DISPATCH_RATE_PER_SEC", "25"))
+    DISPATCH_PER_CHAT_INTERVAL: float = float(os.getenv("DISPATCH_PER_CHAT_INTERVAL", "1.0"))
+    DISPATCH_MAX_RETRIES: int = int(os.getenv("DISPATCH_MAX_RETRIES", "3"))
+    # Несколько реплик: id реплики, период heartbeat и срок аренды лидера (сек)
+    REPLICA_ID: str = os.getenv("REPLICA_ID", "")
+    CLUSTER_HEARTBEAT_SECONDS: float = float(os.getenv("CLUSTER_HEARTBEAT_SECONDS", "15"))
+    CLUSTER_LEASE_SECONDS: float = float(os.getenv("CLUSTER_LEASE_SECONDS", "45"))
+    # Как часто реплики перечитывают расписание и дедлайны, изменённые через другие реплики
+    CLUSTER_RESYNC_SECONDS: float = float(os.getenv("CLUSTER_RESYNC_SECONDS", "300"))
+    # Как часто реплики подхватывают только изменённые домашки и расписания (по updated_at)
+    CLUSTER_CHANGES_SECONDS: float = float(os.getenv("CLUSTER_CHANGES_SECONDS", "30"))
+    # Получать апдейты может только одна реплика; остальные запускаются с BOT_POLLING=false и только рассылают
+    BOT_POLLING: bool = os.getenv("BOT_POLLING", "true").lower() == "true"
+    # Напоминания о дедлайнах: размер пачки при выборке и максимальный интервал сна движка
+    DEADLINE_BATCH_SIZE: int = int(os.getenv("DEADLINE_BATCH_SIZE", "500"))
+    DEADLINE_TICK_SECONDS: float = float(os.getenv("DEADLINE_TICK_SECONDS", "30"))
+    # Outbox уведомлений: число воркеров доставки, размер пачки, интервал опроса, повторы и срок хранения
+    OUTBOX_WORKERS: int = int(os.getenv("OUTBOX_WORKERS", "2"))
+    OUTBOX_BATCH_SIZE: int = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+    OUTBOX_POLL_SECONDS: float = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+    OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+    OUTBOX_RETRY_BASE_SECONDS: float = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "30"))
+    OUTBOX_RETRY_MAX_SECONDS: float = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "3600"))
+    OUTBOX_RETENTION_DAYS: int = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+    # HTTP-клиент портала SDU: размер пула соединений, keep-alive, кэш DNS, таймаут и пул User-Agent
+    PORTAL_POOL_SIZE: int = int(os.getenv("PORTAL_POOL_SIZE", "100"))
+    PORTAL_KEEPALIVE_SECONDS: float = float(os.getenv("PORTAL_KEEPALIVE_SECONDS", "30"))
+    PORTAL_DNS_TTL_SECONDS: int = int(os.getenv("PORTAL_DNS_TTL_SECONDS", "300"))
+    PORTAL_TIMEOUT_SECONDS: float = float(os.getenv("PORTAL_TIMEOUT_SECONDS", "30"))
+    PORTAL_UA_POOL_SIZE: int = int(os.getenv("PORTAL_UA_POOL_SIZE", "20"))
+    # Защита портала: адаптивный лимит параллельных запросов, очередь ожидания и предохранитель
+    PORTAL_CONCURRENCY_INITIAL: int = int(os.getenv("PORTAL_CONCURRENCY_INITIAL", "10"))
+    PORTAL_CONCURRENCY_MIN: int = int(os.getenv("PORTAL_CONCURRENCY_MIN", "2"))
+    PORTAL_CONCURRENCY_MAX: int = int(os.getenv("PORTAL_CONCURRENCY_MAX", "50"))
+    PORTAL_TARGET_LATENCY_SECONDS: float = float(os.getenv("PORTAL_TARGET_LATENCY_SECONDS", "5"))
+    PORTAL_QUEUE_LIMIT: int = int(os.getenv("PORTAL_QUEUE_LIMIT", "500"))
+    PORTAL_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("PORTAL_QUEUE_TIMEOUT_SECONDS", "60"))
+    PORTAL_BREAKER_FAILURES: int = int(os.getenv("PORTAL_BREAKER_FAILURES", "5"))
+    PORTAL_BREAKER_RESET_SECONDS: float = float(os.getenv("PORTAL_BREAKER_RESET_SECONDS", "30"))
+    # Сколько секунд повторный /parse отдаёт результат последнего обновления, не обращаясь к порталу
+    SCHEDULE_REFRESH_FRESHNESS_SECONDS: float = float(os.getenv("SCHEDULE_REFRESH_FRESHNESS_SECONDS", "60"))
+    # Разбор HTML расписания вне event loop: "thread" или "process" и число воркеров
+    PARSE_POOL_KIND: str = os.getenv("PARSE_POOL_KIND", "thread").lower()
+    PARSE_POOL_WORKERS: int = int(os.getenv("PARSE_POOL_WORKERS", "2"))
+    # Сколько строк уходит в один executemany при массовой записи (занятия, вложения домашек)
+    BULK_INSERT_BATCH_SIZE: int = int(os.getenv("BULK_INSERT_BATCH_SIZE", "1000"))
+    # Кэш активности сессий портала для /start: TTL, размер пачки и параллельность фоновой перепроверки
+    SESSION_CACHE_TTL_SECONDS: float = float(os.getenv("SESSION_CACHE_TTL_SECONDS", "600"))
+    SESSION_CACHE_MAX_ENTRIES: int = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "50000"))
+    SESSION_REVALIDATE_BATCH: int = int(os.getenv("SESSION_REVALIDATE_BATCH", "50"))
+    SESSION_REVALIDATE_CONCURRENCY: int = int(os.getenv("SESSION_REVALIDATE_CONCURRENCY", "10"))
+    # Сколько считаем живой сессию портала после входа и когда (часы cron) её заранее продлевать
+    SDU_SESSION_LIFETIME_HOURS: float = float(os.getenv("SDU_SESSION_LIFETIME_HOURS", "12"))
+    SESSION_KEEPER_HOURS: str = os.getenv("SESSION_KEEPER_HOURS", "3-5")
+    SESSION_KEEPER_BATCH: int = int(os.getenv("SESSION_KEEPER_BATCH", "200"))
+    SESSION_KEEPER_CONCURRENCY: int = int(os.getenv("SESSION_KEEPER_CONCURRENCY", "5"))
 
 
 settings = Settings()
@@ -0,0 +1,41 @@
+"""Add scheduler replica heartbeats and leader lease tables
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '003'
+down_revision: Union[str, None] = '002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'scheduler_replicas',
+        sa.Column('replica_id', sa.String(length=64), primary_key=True),
+        sa.Column('heartbeat_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index('ix_scheduler_replicas_heartbeat_at', 'scheduler_replicas', ['heartbeat_at'])
+
+    op.create_table(
+        'scheduler_leases',
+        sa.Column('name', sa.String(length=64), primary_key=True),
+        sa.Column('holder', sa.String(length=64), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('scheduler_leases')
+    op.drop_index('ix_scheduler_replicas_heartbeat_at', 'scheduler_replicas')
+    op.drop_table('scheduler_replicas')
@@ -0,0 +1,38 @@
+"""Add schedule snapshots table
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-16 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '005'
+down_revision: Union[str, None] = '004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'schedule_snapshots',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('term', sa.Integer(), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('lessons_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.UniqueConstraint('user_id', 'year', 'term', name='uq_schedule_snapshots_user_term'),
+    )
+    op.create_index('ix_schedule_snapshots_user_id', 'schedule_snapshots', ['user_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_schedule_snapshots_user_id', 'schedule_snapshots')
+    op.drop_table('schedule_snapshots')
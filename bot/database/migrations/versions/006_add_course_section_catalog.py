@@ -0,0 +1,64 @@
+"""Add course and section catalog with user membership
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-16 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '006'
+down_revision: Union[str, None] = '005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'courses',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('code', sa.String(length=32), nullable=False, unique=True),
+        sa.Column('title', sa.String(length=255), nullable=True),
+    )
+    op.create_table(
+        'course_sections',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('course_id', sa.Integer(), sa.ForeignKey('courses.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('section_code', sa.String(length=16), nullable=False),
+        sa.Column('lesson_type', sa.String(length=32), nullable=True),
+        sa.Column('teacher', sa.String(length=255), nullable=True),
+        sa.UniqueConstraint('course_id', 'section_code', name='uq_course_sections_course_section'),
+    )
+    op.create_index('ix_course_sections_course_id', 'course_sections', ['course_id'])
+    op.create_table(
+        'section_meetings',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('section_id', sa.Integer(), sa.ForeignKey('course_sections.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('day_of_week', sa.Integer(), nullable=False),
+        sa.Column('start_time', sa.String(length=16), nullable=False),
+        sa.Column('end_time', sa.String(length=16), nullable=False),
+        sa.Column('room', sa.String(length=64), nullable=True),
+        sa.UniqueConstraint('section_id', 'day_of_week', 'start_time', name='uq_section_meetings_section_slot'),
+    )
+    op.create_index('ix_section_meetings_section_id', 'section_meetings', ['section_id'])
+    op.create_table(
+        'user_sections',
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('section_id', sa.Integer(), sa.ForeignKey('course_sections.id', ondelete='CASCADE'), primary_key=True),
+    )
+    op.create_index('ix_user_sections_section_id', 'user_sections', ['section_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_sections_section_id', 'user_sections')
+    op.drop_table('user_sections')
+    op.drop_index('ix_section_meetings_section_id', 'section_meetings')
+    op.drop_table('section_meetings')
+    op.drop_index('ix_course_sections_course_id', 'course_sections')
+    op.drop_table('course_sections')
+    op.drop_table('courses')
@@ -0,0 +1,36 @@
+"""One portal session row per user
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '007'
+down_revision: Union[str, None] = '006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Оставляем только самую свежую сессию каждого пользователя
+    op.execute(
+        sa.text(
+            "DELETE FROM user_sessions WHERE id NOT IN "
+            "(SELECT id FROM (SELECT MAX(id) AS id FROM user_sessions GROUP BY user_id) AS latest)"
+        )
+    )
+    # Сначала уникальный индекс: MySQL не даёт удалить единственный индекс под внешним ключом
+    op.create_index('uq_user_sessions_user_id', 'user_sessions', ['user_id'], unique=True)
+    op.drop_index('ix_user_sessions_user_id', 'user_sessions')
+
+
+def downgrade() -> None:
+    op.create_index('ix_user_sessions_user_id', 'user_sessions', ['user_id'])
+    op.drop_index('uq_user_sessions_user_id', 'user_sessions')
@@ -0,0 +1,89 @@
+"""Link schedule lessons to catalog meetings instead of copying title, teacher and room.
+Lessons without a course code have no meeting and keep their own copies
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '008'
+down_revision: Union[str, None] = '007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Встреча каталога для занятия: тот же курс, секция, день и начало
+_LESSON_MEETING = (
+    "SELECT m.id FROM section_meetings m "
+    "JOIN course_sections cs ON cs.id = m.section_id "
+    "JOIN courses c ON c.id = cs.course_id "
+    "WHERE c.code = schedule_lessons.course_code "
+    "AND cs.section_code = COALESCE(schedule_lessons.section_code, '') "
+    "AND m.day_of_week = schedule_lessons.day_of_week "
+    "AND m.start_time = schedule_lessons.start_time"
+)
+
+
+def _backfill_catalog() -> None:
+    """Переносит в каталог занятия пользователей, ни разу не импортированных после 006"""
+    op.execute(sa.text(
+        "INSERT INTO courses (code, title) "
+        "SELECT sl.course_code, MAX(sl.title) FROM schedule_lessons sl "
+        "WHERE sl.course_code IS NOT NULL AND sl.course_code <> '' "
+        "AND sl.course_code NOT IN (SELECT code FROM courses) "
+        "GROUP BY sl.course_code"
+    ))
+    op.execute(sa.text(
+        "INSERT INTO course_sections (course_id, section_code, lesson_type, teacher) "
+        "SELECT c.id, COALESCE(sl.section_code, ''), MAX(sl.lesson_type), MAX(sl.teacher) "
+        "FROM schedule_lessons sl JOIN courses c ON c.code = sl.course_code "
+        "WHERE NOT EXISTS (SELECT 1 FROM course_sections cs "
+        "WHERE cs.course_id = c.id AND cs.section_code = COALESCE(sl.section_code, '')) "
+        "GROUP BY c.id, COALESCE(sl.section_code, '')"
+    ))
+    op.execute(sa.text(
+        "INSERT INTO section_meetings (section_id, day_of_week, start_time, end_time, room) "
+        "SELECT cs.id, sl.day_of_week, sl.start_time, MAX(sl.end_time), MAX(sl.room) "
+        "FROM schedule_lessons sl JOIN courses c ON c.code = sl.course_code "
+        "JOIN course_sections cs ON cs.course_id = c.id AND cs.section_code = COALESCE(sl.section_code, '') "
+        "WHERE NOT EXISTS (SELECT 1 FROM section_meetings m "
+        "WHERE m.section_id = cs.id AND m.day_of_week = sl.day_of_week AND m.start_time = sl.start_time) "
+        "GROUP BY cs.id, sl.day_of_week, sl.start_time"
+    ))
+
+
+def upgrade() -> None:
+    _backfill_catalog()
+    op.add_column('schedule_lessons', sa.Column('meeting_id', sa.Integer(), nullable=True))
+    op.execute(sa.text(f"UPDATE schedule_lessons SET meeting_id = ({_LESSON_MEETING})"))
+    op.create_index('ix_schedule_lessons_meeting_id', 'schedule_lessons', ['meeting_id'])
+    op.create_foreign_key(
+        'fk_schedule_lessons_meeting_id', 'schedule_lessons', 'section_meetings',
+        ['meeting_id'], ['id'], ondelete='SET NULL',
+    )
+    # У связанных занятий эти поля теперь читаются из каталога
+    op.execute(sa.text(
+        "UPDATE schedule_lessons SET title = NULL, teacher = NULL, room = NULL WHERE meeting_id IS NOT NULL"
+    ))
+
+
+def downgrade() -> None:
+    op.execute(sa.text(
+        "UPDATE schedule_lessons SET "
+        "title = (SELECT c.title FROM section_meetings m JOIN course_sections cs ON cs.id = m.section_id "
+        "JOIN courses c ON c.id = cs.course_id WHERE m.id = schedule_lessons.meeting_id), "
+        "teacher = (SELECT cs.teacher FROM section_meetings m JOIN course_sections cs ON cs.id = m.section_id "
+        "WHERE m.id = schedule_lessons.meeting_id), "
+        "room = (SELECT m.room FROM section_meetings m WHERE m.id = schedule_lessons.meeting_id) "
+        "WHERE meeting_id IS NOT NULL"
+    ))
+    op.drop_constraint('fk_schedule_lessons_meeting_id', 'schedule_lessons', type_='foreignkey')
+    op.drop_index('ix_schedule_lessons_meeting_id', 'schedule_lessons')
+    op.drop_column('schedule_lessons', 'meeting_id')
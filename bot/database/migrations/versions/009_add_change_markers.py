@@ -0,0 +1,32 @@
+"""Index change timestamps so replicas can pick up each other's homework and schedule changes
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '009'
+down_revision: Union[str, None] = '008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('homeworks', sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True))
+    op.execute(sa.text("UPDATE homeworks SET updated_at = created_at"))
+    op.alter_column('homeworks', 'updated_at', existing_type=sa.DateTime(timezone=True), nullable=False)
+    op.create_index('ix_homeworks_updated_at', 'homeworks', ['updated_at'])
+    op.create_index('ix_schedule_snapshots_updated_at', 'schedule_snapshots', ['updated_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_schedule_snapshots_updated_at', 'schedule_snapshots')
+    op.drop_index('ix_homeworks_updated_at', 'homeworks')
+    op.drop_column('homeworks', 'updated_at')
@@ -0,0 +1,37 @@
+"""Drop user_sections: lessons reach the catalog through schedule_lessons.meeting_id
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '010'
+down_revision: Union[str, None] = '009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_index('ix_user_sections_section_id', 'user_sections')
+    op.drop_table('user_sections')
+
+
+def downgrade() -> None:
+    op.create_table(
+        'user_sections',
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('section_id', sa.Integer(), sa.ForeignKey('course_sections.id', ondelete='CASCADE'), primary_key=True),
+    )
+    op.create_index('ix_user_sections_section_id', 'user_sections', ['section_id'])
+    op.execute(sa.text(
+        "INSERT INTO user_sections (user_id, section_id) "
+        "SELECT DISTINCT sl.user_id, m.section_id FROM schedule_lessons sl "
+        "JOIN section_meetings m ON m.id = sl.meeting_id"
+    ))
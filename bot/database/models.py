@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime
 
-from sqlalchemy import BigInteger, DateTime, ForeignKey, Integer, String, Boolean, Text, Enum
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, Integer, String, Boolean, Text, Enum, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .session import Base
@@ -39,6 +39,8 @@ class Homework(Base):
     done_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     archived_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    # По нему реплики подхватывают домашки, созданные и изменённые через другие реплики
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     user: Mapped[User] = relationship(back_populates="homeworks")
     lesson: Mapped["ScheduleLesson | None"] = relationship()  # Связь с уроком
@@ -84,9 +86,11 @@ class HomeworkArchive(Base):
 
 class UserSession(Base):
     __tablename__ = "user_sessions"
+    # Одна сессия портала на пользователя: повторный вход обновляет строку через upsert
+    __table_args__ = (UniqueConstraint("user_id", name="uq_user_sessions_user_id"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
     access_token: Mapped[str | None] = mapped_column(String(512), nullable=True)
     refresh_token: Mapped[str | None] = mapped_column(String(512), nullable=True)
     cookies_json: Mapped[str | None] = mapped_column(Text, nullable=True)
@@ -109,9 +113,11 @@ class ScheduleLesson(Base):
     start_time: Mapped[str] = mapped_column(String(16))
     end_time: Mapped[str] = mapped_column(String(16))
     course_code: Mapped[str | None] = mapped_column(String(32), nullable=True)
-    title: Mapped[str | None] = mapped_column(String(255), nullable=True)
     lesson_type: Mapped[str | None] = mapped_column(String(32), nullable=True)
     section_code: Mapped[str | None] = mapped_column(String(16), nullable=True)  # [03-N], [14-P], etc
+    # Название, преподаватель и кабинет хранит каталог; свои поля заполнены только у занятий без встречи
+    meeting_id: Mapped[int | None] = mapped_column(ForeignKey("section_meetings.id", ondelete="SET NULL"), nullable=True, index=True)
+    title: Mapped[str | None] = mapped_column(String(255), nullable=True)
     teacher: Mapped[str | None] = mapped_column(String(255), nullable=True)
     room: Mapped[str | None] = mapped_column(String(64), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
@@ -119,5 +125,118 @@ class ScheduleLesson(Base):
     user: Mapped[User] = relationship(back_populates="lessons")
 
     def __str__(self) -> str:
-        title = self.title or self.course_code or "Lesson"
-        return f"ScheduleLesson(id={self.id}, day={self.day_of_week}, time={self.start_time}-{self.end_time}, title={title!r}, room={self.room!r})"
+        title = self.course_code or self.title or "Lesson"
+        return f"ScheduleLesson(id={self.id}, day={self.day_of_week}, time={self.start_time}-{self.end_time}, title={title!r}, meeting_id={self.meeting_id})"
+
+
+class Course(Base):
+    """Общий каталог курсов: одна строка на код курса для всех пользователей"""
+    __tablename__ = "courses"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    code: Mapped[str] = mapped_column(String(32), unique=True)
+    title: Mapped[str | None] = mapped_column(String(255), nullable=True)
+
+    sections: Mapped[list["CourseSection"]] = relationship(back_populates="course", cascade="all, delete-orphan")
+
+    def __str__(self) -> str:
+        return f"Course(id={self.id}, code={self.code!r})"
+
+
+class CourseSection(Base):
+    """Секция курса ([03-N], [14-P]); преподаватель и тип общие для всех её студентов"""
+    __tablename__ = "course_sections"
+    __table_args__ = (UniqueConstraint("course_id", "section_code", name="uq_course_sections_course_section"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    course_id: Mapped[int] = mapped_column(ForeignKey("courses.id", ondelete="CASCADE"), index=True)
+    section_code: Mapped[str] = mapped_column(String(16))
+    lesson_type: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    teacher: Mapped[str | None] = mapped_column(String(255), nullable=True)
+
+    course: Mapped[Course] = relationship(back_populates="sections")
+    meetings: Mapped[list["SectionMeeting"]] = relationship(back_populates="section", cascade="all, delete-orphan")
+
+    def __str__(self) -> str:
+        return f"CourseSection(id={self.id}, course_id={self.course_id}, section={self.section_code!r})"
+
+
+class SectionMeeting(Base):
+    """Занятие секции в сетке недели"""
+    __tablename__ = "section_meetings"
+    __table_args__ = (
+        UniqueConstraint("section_id", "day_of_week", "start_time", name="uq_section_meetings_section_slot"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    section_id: Mapped[int] = mapped_column(ForeignKey("course_sections.id", ondelete="CASCADE"), index=True)
+    day_of_week: Mapped[int] = mapped_column(Integer)  # 1=Mon..6=Sat
+    start_time: Mapped[str] = mapped_column(String(16))
+    end_time: Mapped[str] = mapped_column(String(16))
+    room: Mapped[str | None] = mapped_column(String(64), nullable=True)
+
+    section: Mapped[CourseSection] = relationship(back_populates="meetings")
+
+    def __str__(self) -> str:
+        return f"SectionMeeting(id={self.id}, section_id={self.section_id}, day={self.day_of_week}, time={self.start_time}-{self.end_time})"
+
+
+class ScheduleSnapshot(Base):
+    """Хэш последнего импортированного расписания пользователя за год и семестр"""
+    __tablename__ = "schedule_snapshots"
+    __table_args__ = (UniqueConstraint("user_id", "year", "term", name="uq_schedule_snapshots_user_term"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    year: Mapped[int] = mapped_column(Integer)
+    term: Mapped[int] = mapped_column(Integer)
+    content_hash: Mapped[str] = mapped_column(String(64))  # sha256 нормализованного списка занятий
+    lessons_count: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, index=True)
+
+    def __str__(self) -> str:
+        return f"ScheduleSnapshot(user_id={self.user_id}, year={self.year}, term={self.term}, hash={self.content_hash[:12]})"
+
+
+class SchedulerReplica(Base):
+    __tablename__ = "scheduler_replicas"
+
+    replica_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    heartbeat_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, index=True)
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+
+    def __str__(self) -> str:
+        return f"SchedulerReplica(replica_id={self.replica_id!r}, heartbeat_at={self.heartbeat_at.isoformat()})"
+
+
+class SchedulerLease(Base):
+    __tablename__ = "scheduler_leases"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    holder: Mapped[str] = mapped_column(String(64))
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+    def __str__(self) -> str:
+        return f"SchedulerLease(name={self.name!r}, holder={self.holder!r}, expires_at={self.expires_at.isoformat()})"
+
+
+class NotificationOutbox(Base):
+    __tablename__ = "notification_outbox"
+    __table_args__ = (Index("ix_notification_outbox_status_next", "status", "next_attempt_at"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, index=True)
+    text: Mapped[str] = mapped_column(Text())
+    reply_markup: Mapped[str | None] = mapped_column(Text(), nullable=True)  # InlineKeyboardMarkup в JSON
+    dedupe_key: Mapped[str | None] = mapped_column(String(191), unique=True, nullable=True)
+    status: Mapped[str] = mapped_column(String(16), default="pending")  # pending, sending, sent, failed
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    claimed_by: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    claimed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_error: Mapped[str | None] = mapped_column(String(512), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    def __str__(self) -> str:
+        return f"NotificationOutbox(id={self.id}, chat_id={self.chat_id}, status={self.status!r}, attempts={self.attempts})"
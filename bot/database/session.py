@@ -77,5 +77,3 @@ async def get_session() -> AsyncGenerator[AsyncSession, None]:
     assert async_session_maker is not None
     async with async_session_maker() as session:
         yield session
-
-
@@ -11,6 +11,9 @@ from sqlalchemy import select, func, text
 from bot.config import settings
 from bot.database.session import get_session
 from bot.database.models import User, Homework
+from bot.services.dispatcher import OutgoingMessage
+from bot.services.outbox import enqueue_messages
+from bot.services.parse_pool import parse_pool
 
 
 router = Router(name="admin")
@@ -55,25 +58,21 @@ async def cmd_broadcast(message: Message) -> None:
     broadcast_text = text_parts[1]
 
     async for db in get_session():
-        users = (await db.execute(select(User).where(User.telegram_id.is_not(None)))).scalars().all()
+        telegram_ids = (await db.execute(select(User.telegram_id).where(User.telegram_id.is_not(None)))).scalars().all()
 
-        success_count = 0
-        error_count = 0
+        status_message = await message.answer("📤 Ставлю рассылку в очередь...")
 
-        status_message = await message.answer("📤 Начинаю рассылку...")
-
-        for user in users:
-            try:
-                await message.bot.send_message(user.telegram_id, broadcast_text)
-                success_count += 1
-            except Exception:
-                error_count += 1
+        # Ключ по id команды: повторная доставка того же апдейта не продублирует рассылку
+        queued = await enqueue_messages(
+            OutgoingMessage(telegram_id, broadcast_text, dedupe_key=f"bc:{message.chat.id}:{message.message_id}:{telegram_id}")
+            for telegram_id in telegram_ids
+        )
 
         result_text = (
-            f"📊 <b>Результаты рассылки:</b>\n\n"
-            f"✅ Успешно отправлено: {success_count}\n"
-            f"❌ Ошибок: {error_count}\n"
-            f"📈 Всего пользователей: {len(users)}"
+            f"📊 <b>Рассылка поставлена в очередь:</b>\n\n"
+            f"📤 Сообщений в очереди: {queued}\n"
+            f"📈 Всего пользователей: {len(telegram_ids)}\n\n"
+            f"Доставка идёт в фоне с учётом лимитов Telegram."
         )
 
         await status_message.edit_text(result_text, parse_mode="HTML")
@@ -109,8 +108,11 @@ async def cmd_stats(message: Message) -> None:
         )).scalar_one()
 
         # Статистика расписания
-        from bot.database.models import ScheduleLesson
+        from bot.database.models import CourseSection, ScheduleLesson, SectionMeeting
         schedule_lessons = (await db.execute(select(func.count()).select_from(ScheduleLesson))).scalar_one()
+        catalog_sections = (await db.execute(select(func.count()).select_from(CourseSection))).scalar_one()
+        catalog_meetings = (await db.execute(select(func.count()).select_from(SectionMeeting))).scalar_one()
+        parse_stats = parse_pool.stats()
 
         stats_text = f"""
 📊 <b>Статистика SDU Homework Bot</b>
@@ -127,9 +129,11 @@ async def cmd_stats(message: Message) -> None:
 
 📅 <b>Расписание:</b>
 • Всего занятий в базе: {schedule_lessons}
+• Каталог: секций {catalog_sections}, занятий секций {catalog_meetings}
+• Разбор HTML ({parse_stats.kind}, воркеров: {parse_stats.workers}): в очереди {parse_stats.queued}, пик {parse_stats.max_queued}, выполнено {parse_stats.completed}, ошибок {parse_stats.failed}, в среднем {parse_stats.avg_seconds * 1000:.0f} мс
 
 🔧 <b>Система:</b>
-• Планировщик: Активен (проверки каждый час в XX:15)
+• Планировщик: Активен (уведомления по времени занятий)
 • Архивация: Еженедельно по понедельникам в 02:00
 • Напоминания: 20:00 ежедневно
 """
@@ -298,7 +302,7 @@ async def cmd_admin_help(message: Message) -> None:
    Позволяет выполнять прямые запросы к базе данных
    
 🔧 <b>Техническая информация:</b>
-• Планировщики работают каждый час в XX:15
+• Уведомления об уроках: по времени начала и окончания занятий
 • Архивация: понедельник 02:00
 • Вечерние напоминания: ежедневно 20:00
 
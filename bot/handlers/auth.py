@@ -7,8 +7,9 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message
 
 from bot.database.session import get_session
-from bot.services.auth import verify_sdu_credentials, create_or_update_user, save_user_session
-from bot.services.schedule import fetch_and_import_schedule, fetch_and_import_schedule_new
+from bot.services.auth import record_login, verify_sdu_credentials
+from bot.services.portal import PortalUnavailable, QueueNotice, portal_queue
+from bot.services.schedule_imports import LOGIN_HEADER, STAGE_TEXT, schedule_imports
 
 router = Router(name="auth")
 
@@ -42,21 +43,30 @@ async def process_password(message: Message, state: FSMContext) -> None:
         await state.clear()
         return
 
-    ok, sess = await verify_sdu_credentials(username, password)
+    notice = QueueNotice(message)
+    try:
+        with portal_queue(notice):
+            ok, sess = await verify_sdu_credentials(username, password)
+    except PortalUnavailable as e:
+        await message.answer(
+            f"⚠️ Портал SDU сейчас перегружен или недоступен. Попробуйте /login через {max(1, int(e.retry_after))} сек."
+        )
+        await state.clear()
+        return
     if not ok:
         await message.answer("Неверный логин или пароль. Попробуйте снова: /login")
         await state.clear()
         return
 
     async for db in get_session():
-        user = await create_or_update_user(db, telegram_id=message.from_user.id, username=username, password=password)
-        await save_user_session(db, user, sess)
-        # Fetch schedule right after successful login
-        try:
-            imported = await fetch_and_import_schedule_new(db, user.id, session_payload=sess)
-            await message.answer(f"Вы успешно вошли! ✅\nИмпортировано занятий: {imported}")
-        except Exception:
-            await message.answer("Вы успешно вошли! ✅")
+        user_id = await record_login(db, message.from_user.id, username, password, sess)
+    # Отвечаем сразу: расписание загружается в фоне, свежие cookies избавляют от повторного входа
+    text = f"{LOGIN_HEADER}\n{STAGE_TEXT['start']}"
+    # Если пользователь ждал в очереди к порталу, дальше правим то же сообщение
+    if notice.status is not None:
+        status = await notice.status.edit_text(text)
+    else:
+        status = await message.answer(text)
+    if not schedule_imports.start(user_id, status, username=username, password=password, session_payload=sess):
+        await status.edit_text(f"{LOGIN_HEADER}\nРасписание уже загружается, результат придёт в предыдущем сообщении")
     await state.clear()
-
-
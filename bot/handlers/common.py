@@ -132,7 +132,7 @@ async def help_handler(message: Message) -> None:
 /thn - 🧪 Тестировать систему напоминаний
 
 <b>🛠 Техническая информация:</b>
-• Планировщики работают в фоне каждый час в XX:15
+• Уведомления об уроках приходят точно по времени начала и окончания занятий
 • Архивация выполняется еженедельно по понедельникам
 • Все данные сохраняются в зашифрованном виде
 """
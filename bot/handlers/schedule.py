@@ -8,7 +8,8 @@ from sqlalchemy import select
 
 from bot.database.session import get_session
 from bot.database.models import User, UserSession
-from bot.services.schedule import import_schedule_html, fetch_and_import_schedule_new
+from bot.services.portal import PortalUnavailable, QueueNotice, portal_queue
+from bot.services.schedule import ScheduleFetchError, import_schedule_html, refresh_schedule
 
 
 router = Router(name="schedule")
@@ -31,8 +32,11 @@ async def import_schedule_cmd(message: Message) -> None:
         if not user:
             await message.answer("Сначала выполните /login")
             return
-        count = await import_schedule_html(db, user.id, html)
-        await message.answer(f"Импортировано занятий: {count}")
+        result = await import_schedule_html(db, user.id, html)
+        if result.imported and not result.changed:
+            await message.answer(f"Расписание не изменилось, занятий: {result.imported}")
+        else:
+            await message.answer(f"Импортировано занятий: {result.imported}")
 
 
 def schedule_inline_keyboard(current_part: int) -> InlineKeyboardMarkup:
@@ -52,10 +56,9 @@ def schedule_inline_keyboard(current_part: int) -> InlineKeyboardMarkup:
 
 
 async def get_formatted_schedule(user_id: int, part: int = 0) -> str:
-    from sqlalchemy import select
     from collections import defaultdict
     from tabulate import tabulate
-    from bot.database.models import ScheduleLesson
+    from bot.services.catalog import load_user_lessons
 
     # days split
     days = ["MO", "TU", "WE"] if part == 0 else ["TH", "FR", "SA"]
@@ -63,12 +66,8 @@ async def get_formatted_schedule(user_id: int, part: int = 0) -> str:
 
     lessons = []
     async for db in get_session():
-        lessons = (
-            await db.execute(
-                select(ScheduleLesson)
-                .where(ScheduleLesson.user_id == user_id)
-            )
-        ).scalars().all()
+        # Кабинет берётся из общего каталога по встрече секции
+        lessons = await load_user_lessons(db, user_id)
 
     # Создаем таблицу расписания
     schedule_table = defaultdict(lambda: {day: "" for day in days})
@@ -183,41 +182,63 @@ async def schedule_callback_handler(callback: CallbackQuery) -> None:
 @router.message(Command("parse"))
 async def parse_schedule_cmd(message: Message) -> None:
     """Команда для автомат��ического обновления расписания с сайта SDU"""
+    user_id = username = password = None
     async for db in get_session():
-        # Проверяем, что пользователь авторизован
         user = (await db.execute(select(User).where(User.telegram_id == message.from_user.id))).scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала выполните /login для авторизации")
-            return
+        if user:
+            user_id, username, password = user.id, user.username, user.password
+    # Сессия БД закрыта до обращения к порталу: ожидание в очереди и вход не держат соединение из пула
 
-        # Проверяем, что у пользователя есть правильные учетные данные (не временные)
-        if not user.username or not user.password or user.username.startswith('temp_user_') or user.password == 'temp':
-            await message.answer(
-                "❌ У вас нет действительных учетных данных SDU.\n\n"
-                "Выполните /login чтобы войти в систему с вашими реальными данными SDU, "
-                "после чего вы сможете обновлять расписание."
-            )
-            return
+    # Проверяем, что пользователь авторизован
+    if user_id is None:
+        await message.answer("❌ Сначала выполните /login для авторизации")
+        return
 
-        # Отправляем сообщение о начале парсинга
-        status_message = await message.answer("🔄 Обновляю расписание с сайта SDU...")
+    # Проверяем, что у пользователя есть правильные учетные данные (не временные)
+    if not username or not password or username.startswith('temp_user_') or password == 'temp':
+        await message.answer(
+            "❌ У вас нет действительных учетных данных SDU.\n\n"
+            "Выполните /login чтобы войти в систему с вашими реальными данными SDU, "
+            "после чего вы сможете обновлять расписание."
+        )
+        return
 
-        try:
-            # Используем новую функцию парсинга с username и password
-            count = await fetch_and_import_schedule_new(
-                db=db,
-                user_id=user.id,
-                username=user.username,
-                password=user.password
-            )
+    # Отправляем сообщение о начале парсинга
+    status_message = await message.answer("🔄 Обновляю расписание с сайта SDU...")
 
-            if count > 0:
-                await status_message.edit_text(f"✅ Расписание успешно обновлено!\nИмпортировано занятий: {count}")
-            else:
-                await status_message.edit_text("⚠️ Расписание обновлено, но новых занятий не найдено")
+    try:
+        # Используем новую функцию парсинга с username и password
+        with portal_queue(QueueNotice(message, status_message)):
+            result = await refresh_schedule(
+                user_id=user_id,
+                username=username,
+                password=password
+            )
 
-        except Exception as e:
-            await status_message.edit_text(f"❌ Ошибка при обновлении расписания:\n{str(e)}")
-            # Логируем ошибку
-            import logging
-            logging.exception("Ошибка при парсинга расписания")
+        if result.imported > 0 and not result.changed:
+            await status_message.edit_text(f"✅ Изменений нет, расписание актуально.\nЗанятий: {result.imported}")
+        elif result.imported > 0:
+            text = f"✅ Расписание успешно обновлено!\nИмпортировано занятий: {result.imported}"
+            if result.diff is not None:
+                text += (
+                    f"\nДобавлено: {result.diff.inserted}, изменено: {result.diff.updated}, "
+                    f"удалено: {result.diff.deleted}"
+                )
+            await status_message.edit_text(text)
+        else:
+            await status_message.edit_text("⚠️ Расписание обновлено, но новых занятий не найдено")
+
+    except PortalUnavailable as e:
+        await status_message.edit_text(
+            f"⚠️ Портал SDU сейчас перегружен или недоступен.\nПопробуйте /parse через {max(1, int(e.retry_after))} сек."
+        )
+    except ScheduleFetchError:
+        await status_message.edit_text(
+            "❌ Не удалось получить расписание с портала SDU.\n"
+            "Проверьте данные входа через /login и попробуйте /parse позже."
+        )
+    except Exception as e:
+        await status_message.edit_text(f"❌ Ошибка при обновлении расписания:\n{str(e)}")
+        # Логируем ошибку
+        import logging
+        logging.exception("Ошибка при парсинга расписания")
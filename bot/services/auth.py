@@ -1,16 +1,19 @@
 from __future__ import annotations
 
 import json
+from datetime import datetime, timedelta
 from typing import Optional, Tuple
 import logging
 
 import aiohttp
-from sqlalchemy import select, delete
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from fake_useragent import UserAgent
 
 from bot.config import settings
 from bot.database.models import User, UserSession
+from bot.services.bulk import upsert_row
+from bot.services.portal import PortalUnavailable, portal_client
+from bot.services.session_cache import session_cache
 from bs4 import BeautifulSoup as BS
 
 # Константы для логина
@@ -28,8 +31,7 @@ async def login_user(username: str, password: str, session: aiohttp.ClientSessio
     login_data['password'] = password
 
     if session is None:
-        HEADERS = {'User-Agent': UserAgent().random}
-        async with aiohttp.ClientSession(headers=HEADERS) as new_session:
+        async with portal_client.session() as new_session:
             return await _perform_login(new_session, login_data)
     else:
         return await _perform_login(session, login_data)
@@ -45,11 +47,14 @@ async def _perform_login(session: aiohttp.ClientSession, login_data: dict) -> bo
             return False
     return True
 
+def jar_cookies(session: aiohttp.ClientSession) -> dict:
+    return {c.key: c.value for c in session.cookie_jar}
+
+
 async def verify_sdu_credentials(username: str, password: str) -> Tuple[bool, dict]:
     """Обновленная функция для проверки учетных данных SDU"""
-    HEADERS = {'User-Agent': UserAgent().random}
-    async with aiohttp.ClientSession(headers=HEADERS) as session:
-        try:
+    try:
+        async with portal_client.session() as session:
             # Используем новую функцию логина
             login_success = await login_user(username, password, session)
 
@@ -57,16 +62,19 @@ async def verify_sdu_credentials(username: str, password: str) -> Tuple[bool, di
                 return False, {}
 
             # Собираем cookies после успешного логина
-            cookies = {c.key: c.value for c in session.cookie_jar}
+            cookies = jar_cookies(session)
 
             if settings.DEBUG:
                 logging.debug(f"SDU login success={login_success} cookies_keys={list(cookies.keys())}")
 
             return True, {"cookies": cookies}
-        except Exception:
-            if settings.DEBUG:
-                logging.exception("SDU login request failed")
-            return False, {}
+    except PortalUnavailable:
+        # Перегрузку портала не выдаём за неверный пароль
+        raise
+    except Exception:
+        if settings.DEBUG:
+            logging.exception("SDU login request failed")
+        return False, {}
 
 
 async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
@@ -81,55 +89,94 @@ async def get_user_by_telegram_id(db: AsyncSession, telegram_id: int) -> Optiona
     return res.scalar_one_or_none()
 
 
-async def create_or_update_user(db: AsyncSession, telegram_id: int, username: str, password: str) -> User:
-    user = await get_user_by_username(db, username)
-    if user:
-        user.telegram_id = telegram_id
-        user.password = password
-    else:
-        user = User(telegram_id=telegram_id, username=username, password=password)
-        db.add(user)
-    await db.commit()
-    await db.refresh(user)
-    return user
+async def upsert_user(db: AsyncSession, telegram_id: int, username: str, password: str) -> int:
+    """Создаёт или обновляет пользователя по username без предварительного SELECT; коммит за вызывающим"""
+    # Telegram-аккаунт, ранее привязанный к другому логину SDU, переезжает на новый
+    await db.execute(
+        update(User).where(User.telegram_id == telegram_id, User.username != username).values(telegram_id=None)
+    )
+    return await upsert_row(
+        db,
+        User.__table__,
+        {"telegram_id": telegram_id, "username": username, "password": password, "created_at": datetime.utcnow()},
+        conflict=("username",),
+        update_fields=("telegram_id", "password"),
+    )
+
+
+def session_expiry(now: Optional[datetime] = None) -> datetime:
+    """До какого момента считаем сессию портала живой после входа"""
+    return (now or datetime.utcnow()) + timedelta(hours=settings.SDU_SESSION_LIFETIME_HOURS)
 
 
-async def save_user_session(db: AsyncSession, user: User, session_payload: dict) -> UserSession:
+async def upsert_user_session(db: AsyncSession, user_id: int, session_payload: dict) -> None:
+    """Единственная строка user_sessions пользователя: вставка или обновление одной командой; коммит за вызывающим"""
     cookies = session_payload.get("cookies")
     data = session_payload.get("data") or {}
-    access_token = data.get("access_token") or data.get("token")
-    refresh_token = data.get("refresh_token")
+    await upsert_row(
+        db,
+        UserSession.__table__,
+        {
+            "user_id": user_id,
+            "access_token": data.get("access_token") or data.get("token"),
+            "refresh_token": data.get("refresh_token"),
+            "cookies_json": json.dumps(cookies) if cookies else None,
+            "created_at": datetime.utcnow(),
+            "expires_at": session_expiry(),
+        },
+        conflict=("user_id",),
+        update_fields=("access_token", "refresh_token", "cookies_json", "created_at", "expires_at"),
+    )
+
 
-    await db.execute(delete(UserSession).where(UserSession.user_id == user.id))
+async def record_login(db: AsyncSession, telegram_id: int, username: str, password: str, session_payload: dict) -> int:
+    """Запись успешного /login: пользователь и его сессия портала — три команды и один коммит. Возвращает user_id"""
+    user_id = await upsert_user(db, telegram_id, username, password)
+    await upsert_user_session(db, user_id, session_payload)
+    await db.commit()
+    session_cache.remember(user_id, session_payload.get("cookies") or {}, active=True)
+    return user_id
 
-    us = UserSession(
-        user_id=user.id,
-        access_token=access_token,
-        refresh_token=refresh_token,
-        cookies_json=json.dumps(cookies) if cookies else None,
-        expires_at=None,
+
+def decode_cookies(cookies_json: Optional[str]) -> Optional[dict]:
+    if not cookies_json:
+        return None
+    try:
+        return json.loads(cookies_json)
+    except ValueError:
+        return None
+
+
+async def load_session_cookies(db: AsyncSession, user_id: int) -> Optional[dict]:
+    """Cookies портала, сохранённые после последнего входа"""
+    cookies_json = (
+        await db.execute(select(UserSession.cookies_json).where(UserSession.user_id == user_id).limit(1))
+    ).scalar_one_or_none()
+    return decode_cookies(cookies_json)
+
+
+async def update_session_cookies(db: AsyncSession, user_id: int, cookies: dict) -> None:
+    """Сохраняет cookies после повторного входа, не трогая токены сессии"""
+    await upsert_row(
+        db,
+        UserSession.__table__,
+        {"user_id": user_id, "cookies_json": json.dumps(cookies), "created_at": datetime.utcnow(), "expires_at": session_expiry()},
+        conflict=("user_id",),
+        update_fields=("cookies_json", "expires_at"),
     )
-    db.add(us)
     await db.commit()
-    await db.refresh(us)
-    return us
+    session_cache.remember(user_id, cookies, active=True)
 
 
 async def is_session_active(db: AsyncSession, user: User) -> bool:
-    sess = (await db.execute(select(UserSession).where(UserSession.user_id == user.id))).scalar_one_or_none()
-    if not sess:
-        return False
-    # Simple ping to a protected page
-    cookies = {}
-    try:
-        if sess.cookies_json:
-            cookies = json.loads(sess.cookies_json)
-    except Exception:
-        cookies = {}
-    import aiohttp
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get("https://my.sdu.edu.kz/index.php?mod=schedule", cookies=cookies, allow_redirects=False) as resp:
-                return resp.status in (200, 302)
-    except Exception:
+    """Ответ из кэша сессий; живой запрос к порталу делает фоновая перепроверка"""
+    state = session_cache.lookup(user.id)
+    if state is not None and not (state.cookies is None and session_cache.is_stale(state)):
+        return state.active
+
+    row = (await db.execute(select(UserSession.cookies_json).where(UserSession.user_id == user.id).limit(1))).first()
+    if row is None:
+        session_cache.remember(user.id, None, active=False)
         return False
+    # Сохранённой сессии верим, пока фоновая проверка не скажет обратное
+    return session_cache.remember(user.id, decode_cookies(row[0]) or {}, active=True, verified=False).active
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Iterable, Mapping, Sequence
+
+from sqlalchemy import Table, bindparam, func, insert, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.config import settings
+from bot.database.models import HomeworkMedia, ScheduleLesson
+from bot.services.schedule_parser import LessonRecord
+
+
+def insert_statement(table: Table, ignore: bool = False):
+    stmt = insert(table)
+    if ignore:
+        # Дубликаты по уникальным ключам молча пропускаются
+        stmt = stmt.prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+    return stmt
+
+
+async def insert_rows(
+    db: AsyncSession,
+    table: Table,
+    rows: Sequence[dict],
+    ignore: bool = False,
+    batch_size: int = settings.BULK_INSERT_BATCH_SIZE,
+) -> int:
+    """Core executemany пачками без ORM: asyncmy собирает пачку в один многострочный INSERT.
+    Возвращает число вставленных строк; коммит остаётся за вызывающим"""
+    if not rows:
+        return 0
+    # executemany через соединение: ORM-вставка не отдаёт rowcount
+    conn = await db.connection()
+    stmt = insert_statement(table, ignore)
+    inserted = 0
+    for i in range(0, len(rows), batch_size):
+        batch = rows[i:i + batch_size]
+        result = await conn.execute(stmt, batch)
+        inserted += result.rowcount if result.rowcount >= 0 else len(batch)
+    return inserted
+
+
+async def update_rows(db: AsyncSession, table: Table, rows: Sequence[dict], fields: Sequence[str]) -> None:
+    """UPDATE ... WHERE id = :_id одним executemany; в строках — "_id" и значения fields"""
+    if not rows:
+        return
+    await (await db.connection()).execute(
+        update(table).where(table.c.id == bindparam("_id")).values({field: bindparam(field) for field in fields}),
+        rows,
+    )
+
+
+async def upsert_row(
+    db: AsyncSession,
+    table: Table,
+    values: dict,
+    conflict: Sequence[str],
+    update_fields: Sequence[str],
+) -> int:
+    """Одна команда INSERT ... ON DUPLICATE KEY UPDATE (MySQL) или ON CONFLICT DO UPDATE (SQLite, PostgreSQL).
+    conflict — уникальный ключ строки; возвращает id вставленной или обновлённой строки"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql.insert(table).values(values)
+        # LAST_INSERT_ID(id) отдаёт id и при обновлении существующей строки
+        stmt = stmt.on_duplicate_key_update(
+            {"id": func.last_insert_id(table.c.id), **{field: stmt.inserted[field] for field in update_fields}}
+        )
+        return (await db.execute(stmt)).lastrowid
+    dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+    stmt = dialect_insert(table).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(conflict), set_={field: stmt.excluded[field] for field in update_fields}
+    ).returning(table.c.id)
+    return (await db.execute(stmt)).scalar_one()
+
+
+# Поля занятия из записи разбора; название, преподаватель и кабинет пишутся в каталог
+LESSON_FIELDS = ("day_of_week", "start_time", "end_time", "course_code", "lesson_type", "section_code")
+# Свои копии полей каталога — только у занятий без встречи (нет кода курса)
+OWN_CATALOG_FIELDS = ("title", "teacher", "room")
+
+
+def lesson_values(record: LessonRecord, meeting_id: int | None = None) -> dict:
+    values = {field: getattr(record, field) for field in LESSON_FIELDS}
+    values["meeting_id"] = meeting_id
+    for field in OWN_CATALOG_FIELDS:
+        values[field] = getattr(record, field) if meeting_id is None else None
+    return values
+
+
+async def insert_lessons(
+    db: AsyncSession,
+    user_id: int,
+    records: Iterable[LessonRecord],
+    meeting_ids: Mapping[LessonRecord, int] | None = None,
+) -> int:
+    """meeting_ids — встреча каталога для записи, см. sync_user_sections"""
+    now = datetime.utcnow()
+    meeting_ids = meeting_ids or {}
+    rows = [
+        {"user_id": user_id, "created_at": now, **lesson_values(record, meeting_ids.get(record))}
+        for record in records
+    ]
+    return await insert_rows(db, ScheduleLesson.__table__, rows)
+
+
+async def insert_homework_media(db: AsyncSession, homework_id: int, media: Iterable[tuple[str, str]]) -> int:
+    now = datetime.utcnow()
+    rows = [
+        {"homework_id": homework_id, "file_type": file_type, "file_id": file_id, "created_at": now}
+        for file_type, file_id in media
+    ]
+    return await insert_rows(db, HomeworkMedia.__table__, rows)
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import logging
+from typing import Iterable, NamedTuple, Sequence
+
+from sqlalchemy import Row, Select, delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.database.models import Course, CourseSection, ScheduleLesson, SectionMeeting
+from bot.services.bulk import insert_rows, update_rows
+from bot.services.schedule_parser import LessonRecord
+
+
+class CatalogSync(NamedTuple):
+    """meeting_ids — встреча каталога для каждой записи с кодом курса;
+    changed — у курсов, секций или встреч пользователя поменялись название, преподаватель, тип, время или кабинет"""
+    meeting_ids: dict[LessonRecord, int]
+    changed: bool
+
+
+async def _upsert_courses(db: AsyncSession, records: list[LessonRecord]) -> tuple[dict[str, int], bool]:
+    titles: dict[str, str] = {}
+    for record in records:
+        titles.setdefault(record.course_code, record.title)
+    table = Course.__table__
+    # Курс, уже добавленный другим пользователем, пропускается INSERT IGNORE
+    await insert_rows(db, table, [{"code": code, "title": title} for code, title in titles.items()], ignore=True)
+
+    ids, renamed = {}, []
+    rows = await db.execute(select(table.c.id, table.c.code, table.c.title).where(table.c.code.in_(titles)))
+    for course_id, code, title in rows:
+        ids[code] = course_id
+        if (title or "") != titles[code]:
+            renamed.append({"_id": course_id, "title": titles[code]})
+    await update_rows(db, table, renamed, ("title",))
+    return ids, bool(renamed)
+
+
+async def _upsert_sections(
+    db: AsyncSession, records: list[LessonRecord], course_ids: dict[str, int]
+) -> tuple[dict[tuple[str, str], int], bool]:
+    details: dict[tuple[str, str], dict] = {}
+    for record in records:
+        details.setdefault(
+            (record.course_code, record.section_code),
+            {
+                "course_id": course_ids[record.course_code],
+                "section_code": record.section_code,
+                "lesson_type": record.lesson_type,
+                "teacher": record.teacher,
+            },
+        )
+    table = CourseSection.__table__
+    await insert_rows(db, table, list(details.values()), ignore=True)
+
+    codes = {course_id: code for code, course_id in course_ids.items()}
+    ids, changed = {}, []
+    rows = await db.execute(
+        select(table.c.id, table.c.course_id, table.c.section_code, table.c.lesson_type, table.c.teacher)
+        .where(table.c.course_id.in_(codes))
+    )
+    for section_id, course_id, section_code, lesson_type, teacher in rows:
+        key = (codes[course_id], section_code)
+        fresh = details.get(key)
+        if fresh is None:
+            continue
+        ids[key] = section_id
+        if (lesson_type or "", teacher or "") != (fresh["lesson_type"], fresh["teacher"]):
+            changed.append({"_id": section_id, "lesson_type": fresh["lesson_type"], "teacher": fresh["teacher"]})
+    await update_rows(db, table, changed, ("lesson_type", "teacher"))
+    return ids, bool(changed)
+
+
+async def _sync_meetings(
+    db: AsyncSession, user_id: int, records: list[LessonRecord], section_ids: dict[tuple[str, str], int]
+) -> tuple[dict[LessonRecord, int], bool]:
+    """Сетка секции берётся из последнего импорта: её видит целиком каждый студент секции.
+    Возвращает id встречи для каждой записи и признак изменения сетки"""
+    fresh: dict[tuple[int, int, str], LessonRecord] = {}
+    for record in records:
+        section_id = section_ids[(record.course_code, record.section_code)]
+        fresh.setdefault((section_id, record.day_of_week, record.start_time), record)
+
+    table = SectionMeeting.__table__
+    slots: dict[tuple[int, int, str], int] = {}
+    stale, changed = [], []
+    rows = await db.execute(
+        select(table.c.id, table.c.section_id, table.c.day_of_week, table.c.start_time, table.c.end_time, table.c.room)
+        .where(table.c.section_id.in_(set(section_ids.values())))
+    )
+    for meeting_id, section_id, day, start, end, room in rows:
+        record = fresh.get((section_id, day, start))
+        if record is None:
+            stale.append(meeting_id)
+            continue
+        slots[(section_id, day, start)] = meeting_id
+        if (end, room or "") != (record.end_time, record.room):
+            changed.append({"_id": meeting_id, "end_time": record.end_time, "room": record.room})
+
+    if stale:
+        # Встречу, на которую ссылаются занятия других студентов, оставляем: у них она ещё в расписании
+        shared = select(ScheduleLesson.meeting_id).where(
+            ScheduleLesson.meeting_id.in_(stale), ScheduleLesson.user_id != user_id
+        )
+        await db.execute(delete(table).where(table.c.id.in_(stale), table.c.id.not_in(shared)))
+    await update_rows(db, table, changed, ("end_time", "room"))
+    missing = {slot: record for slot, record in fresh.items() if slot not in slots}
+    if missing:
+        await insert_rows(
+            db,
+            table,
+            [
+                {"section_id": section_id, "day_of_week": day, "start_time": start,
+                 "end_time": record.end_time, "room": record.room}
+                for (section_id, day, start), record in missing.items()
+            ],
+            ignore=True,
+        )
+        rows = await db.execute(
+            select(table.c.id, table.c.section_id, table.c.day_of_week, table.c.start_time)
+            .where(table.c.section_id.in_({section_id for section_id, _, _ in missing}))
+        )
+        for meeting_id, section_id, day, start in rows:
+            slots.setdefault((section_id, day, start), meeting_id)
+
+    meeting_ids = {
+        record: slots[(section_ids[(record.course_code, record.section_code)], record.day_of_week, record.start_time)]
+        for record in records
+    }
+    return meeting_ids, bool(stale or changed or missing)
+
+
+async def sync_user_sections(db: AsyncSession, user_id: int, records: Iterable[LessonRecord]) -> CatalogSync:
+    """Переносит разобранное расписание в общий каталог. Занятие хранит id встречи вместо названия,
+    преподавателя и кабинета. Коммит остаётся за вызывающим — каталог меняется в одной транзакции с занятиями"""
+    records = [record for record in records if record.course_code]
+    if not records:
+        return CatalogSync({}, False)
+    course_ids, courses_changed = await _upsert_courses(db, records)
+    section_ids, sections_changed = await _upsert_sections(db, records, course_ids)
+    meeting_ids, meetings_changed = await _sync_meetings(db, user_id, records, section_ids)
+    logging.debug(f"Catalog sync: user {user_id} sections={len(section_ids)}")
+    return CatalogSync(meeting_ids, courses_changed or sections_changed or meetings_changed)
+
+
+# Название, преподаватель и кабинет: из каталога, а у занятий без встречи — из самого занятия
+LESSON_CATALOG_COLUMNS = (
+    func.coalesce(Course.title, ScheduleLesson.title).label("title"),
+    func.coalesce(CourseSection.teacher, ScheduleLesson.teacher).label("teacher"),
+    func.coalesce(SectionMeeting.room, ScheduleLesson.room).label("room"),
+)
+
+
+def with_lesson_catalog(query: Select) -> Select:
+    """Подклеивает каталог к запросу по schedule_lessons для LESSON_CATALOG_COLUMNS"""
+    return (
+        query.outerjoin(SectionMeeting, SectionMeeting.id == ScheduleLesson.meeting_id)
+        .outerjoin(CourseSection, CourseSection.id == SectionMeeting.section_id)
+        .outerjoin(Course, Course.id == CourseSection.course_id)
+    )
+
+
+async def load_user_lessons(db: AsyncSession, user_id: int) -> Sequence[Row]:
+    """Занятия пользователя вместе с названием, преподавателем и кабинетом"""
+    return (
+        await db.execute(
+            with_lesson_catalog(
+                select(
+                    ScheduleLesson.id,
+                    ScheduleLesson.day_of_week,
+                    ScheduleLesson.start_time,
+                    ScheduleLesson.end_time,
+                    ScheduleLesson.course_code,
+                    ScheduleLesson.lesson_type,
+                    ScheduleLesson.section_code,
+                    *LESSON_CATALOG_COLUMNS,
+                ).select_from(ScheduleLesson)
+            )
+            .where(ScheduleLesson.user_id == user_id)
+            .order_by(ScheduleLesson.day_of_week, ScheduleLesson.start_time)
+        )
+    ).all()
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+
+from sqlalchemy import delete, insert, select, true, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.config import settings
+from bot.database.models import SchedulerLease, SchedulerReplica
+from bot.database.session import get_session
+
+LEADER_LEASE = "scheduler-leader"
+
+
+def _default_replica_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"[:64]
+
+
+class ClusterMembership:
+    """Реплики бота: аренда лидера для одиночных задач и разбиение рассылок по живым репликам"""
+
+    def __init__(
+        self,
+        replica_id: str | None = None,
+        heartbeat_interval: float = settings.CLUSTER_HEARTBEAT_SECONDS,
+        lease_ttl: float = settings.CLUSTER_LEASE_SECONDS,
+    ) -> None:
+        self.replica_id = replica_id or settings.REPLICA_ID or _default_replica_id()
+        self.heartbeat_interval = heartbeat_interval
+        self.lease_ttl = timedelta(seconds=lease_ttl)
+        # Пока нет данных о других репликах, считаем себя единственной
+        self.is_leader = False
+        self.shard_index = 0
+        self.shard_count = 1
+        self._task: asyncio.Task | None = None
+
+    def owns(self, key: int) -> bool:
+        """Принадлежит ли ключ (telegram_id) шарду этой реплики"""
+        return self.shard_count <= 1 or key % self.shard_count == self.shard_index
+
+    def shard_clause(self, column):
+        """SQL-условие для выборки только своего шарда"""
+        if self.shard_count <= 1:
+            return true()
+        return column % self.shard_count == self.shard_index
+
+    async def _touch_replica(self, db: AsyncSession, now: datetime) -> None:
+        res = await db.execute(
+            update(SchedulerReplica)
+            .where(SchedulerReplica.replica_id == self.replica_id)
+            .values(heartbeat_at=now)
+        )
+        if res.rowcount == 0:
+            await db.execute(insert(SchedulerReplica).values(replica_id=self.replica_id, heartbeat_at=now, started_at=now))
+
+    async def _acquire_lease(self, db: AsyncSession, now: datetime) -> bool:
+        expires_at = now + self.lease_ttl
+        res = await db.execute(
+            update(SchedulerLease)
+            .where(
+                SchedulerLease.name == LEADER_LEASE,
+                (SchedulerLease.holder == self.replica_id) | (SchedulerLease.expires_at < now),
+            )
+            .values(holder=self.replica_id, expires_at=expires_at)
+        )
+        if res.rowcount:
+            return True
+        try:
+            async with db.begin_nested():
+                await db.execute(insert(SchedulerLease).values(name=LEADER_LEASE, holder=self.replica_id, expires_at=expires_at))
+            return True
+        except IntegrityError:
+            # Аренду держит другая живая реплика
+            return False
+
+    async def heartbeat(self) -> None:
+        now = datetime.utcnow()
+        async for db in get_session():
+            await self._touch_replica(db, now)
+            is_leader = await self._acquire_lease(db, now)
+            live = list(
+                (
+                    await db.execute(
+                        select(SchedulerReplica.replica_id)
+                        .where(SchedulerReplica.heartbeat_at >= now - self.lease_ttl)
+                        .order_by(SchedulerReplica.replica_id)
+                    )
+                ).scalars()
+            )
+            if is_leader:
+                # Лидер подчищает давно умершие реплики
+                await db.execute(delete(SchedulerReplica).where(SchedulerReplica.heartbeat_at < now - self.lease_ttl * 10))
+            await db.commit()
+
+        if self.replica_id not in live:
+            live.append(self.replica_id)
+            live.sort()
+        shard = (live.index(self.replica_id), len(live))
+        if is_leader != self.is_leader or shard != (self.shard_index, self.shard_count):
+            logging.info(f"Cluster: replica={self.replica_id} leader={is_leader} shard={shard[0]}/{shard[1]}")
+        self.is_leader = is_leader
+        self.shard_index, self.shard_count = shard
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.heartbeat()
+            except Exception:
+                logging.exception("Cluster heartbeat failed")
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def start(self) -> None:
+        if self._task is None:
+            try:
+                await self.heartbeat()
+            except Exception:
+                logging.exception("Cluster heartbeat failed")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # Освобождаем аренду и выходим из состава, чтобы остальные сразу перераспределили шарды
+        try:
+            async for db in get_session():
+                await db.execute(
+                    update(SchedulerLease)
+                    .where(SchedulerLease.name == LEADER_LEASE, SchedulerLease.holder == self.replica_id)
+                    .values(expires_at=datetime.utcnow())
+                )
+                await db.execute(delete(SchedulerReplica).where(SchedulerReplica.replica_id == self.replica_id))
+                await db.commit()
+        except Exception:
+            logging.exception("Cluster: failed to release lease")
+        self.is_leader = False
+
+
+cluster = ClusterMembership()
+
+
+class ChangeWatermark:
+    """Граница опроса изменений, сделанных через другие реплики.
+    Окно начинается на overlap раньше прошлой проверки: строка может закоммититься позже своего updated_at,
+    а часы реплик немного расходятся; повторно прочитанные строки обрабатываются идемпотентно"""
+
+    def __init__(self, overlap: float = settings.CLUSTER_CHANGES_SECONDS) -> None:
+        self.overlap = timedelta(seconds=overlap)
+        self.checked_at = datetime.utcnow()
+
+    @property
+    def since(self) -> datetime:
+        return self.checked_at - self.overlap
+
+    def mark(self, checked_at: datetime) -> None:
+        """Сдвигает границу только после успешного опроса — иначе изменения из упавшего окна потеряются"""
+        self.checked_at = checked_at
+
+
+def leader_only(func):
+    """Одиночные задачи планировщика выполняет только лидер"""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not cluster.is_leader:
+            logging.debug(f"Skipping {func.__name__}: replica {cluster.replica_id} is not the leader")
+            return None
+        return await func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from aiogram import Bot
+from sqlalchemy import select
+
+from bot.config import settings
+from bot.database.models import Homework, User
+from bot.database.session import get_session
+from bot.services.cluster import ChangeWatermark, cluster
+from bot.services.dispatcher import OutgoingMessage
+from bot.services.outbox import enqueue_messages
+
+# Виды напоминаний: смещение от дедлайна и текст
+KIND_5H = 0
+KIND_10M = 1
+REMINDERS: dict[int, tuple[float, str]] = {
+    KIND_5H: (timedelta(hours=5).total_seconds(), "Сделай домашку (до дедлайна 5 часов)"),
+    KIND_10M: (timedelta(minutes=10).total_seconds(), "Урок скоро, молодец если сделал"),
+}
+# Последнее по времени напоминание — после него запись о домашке можно забыть
+_FINAL_KIND = KIND_10M
+
+
+@dataclass
+class DeadlineLoadStats:
+    scanned: int = 0
+    queued: int = 0
+    elapsed: float = 0.0
+
+
+def _as_local(dt: datetime) -> datetime:
+    # MySQL отдаёт naive datetime; дедлайны считаются в локальном времени бота
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=ZoneInfo(settings.TIMEZONE))
+    return dt
+
+
+class DeadlineEngine:
+    """Напоминания о дедлайнах: куча кортежей (fire_ts, homework_id, kind) вместо задачи APScheduler на каждую домашку"""
+
+    def __init__(self, batch_size: int = settings.DEADLINE_BATCH_SIZE, max_sleep: float = settings.DEADLINE_TICK_SECONDS) -> None:
+        self.batch_size = batch_size
+        self.max_sleep = max_sleep
+        self._heap: list[tuple[float, int, int]] = []
+        # homework_id -> timestamp дедлайна; записи в куче с другим дедлайном считаются устаревшими
+        self._deadlines: dict[int, float] = {}
+        self._cancelled: set[int] = set()
+        self._changes = ChangeWatermark()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, homework_id: int, deadline: datetime | None, now: float | None = None) -> int:
+        """Ставит напоминания для домашки; возвращает число добавленных записей.
+        Дедлайн без будущих напоминаний (снят или уже в прошлом) снимает и старые записи"""
+        if deadline is None:
+            self._forget(homework_id)
+            return 0
+        deadline_ts = _as_local(deadline).timestamp()
+        if self._deadlines.get(homework_id) == deadline_ts:
+            # Записи уже в куче — достаточно снять отмену
+            self._cancelled.discard(homework_id)
+            return 0
+
+        now = time.time() if now is None else now
+        queued = 0
+        for kind, (offset, _) in REMINDERS.items():
+            fire_ts = deadline_ts - offset
+            if fire_ts > now:
+                heapq.heappush(self._heap, (fire_ts, homework_id, kind))
+                queued += 1
+        if queued:
+            self._deadlines[homework_id] = deadline_ts
+            self._cancelled.discard(homework_id)
+            if self._wakeup is not None and self._heap[0][1] == homework_id:
+                self._wakeup.set()
+        else:
+            self._forget(homework_id)
+        return queued
+
+    def _forget(self, homework_id: int) -> None:
+        # Без записи о дедлайне оставшиеся в куче напоминания пропускаются в pop_due
+        self._deadlines.pop(homework_id, None)
+        self._cancelled.discard(homework_id)
+
+    def cancel(self, homework_id: int) -> None:
+        # Ленивое удаление: записи останутся в куче и будут пропущены при выборке
+        if homework_id in self._deadlines:
+            self._cancelled.add(homework_id)
+
+    def pop_due(self, now: float | None = None) -> list[tuple[int, int]]:
+        """Забирает до batch_size наступивших напоминаний: пары (homework_id, kind)"""
+        now = time.time() if now is None else now
+        due: list[tuple[int, int]] = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            fire_ts, homework_id, kind = heapq.heappop(self._heap)
+            deadline_ts = self._deadlines.get(homework_id)
+            if deadline_ts is None or fire_ts != deadline_ts - REMINDERS[kind][0]:
+                continue
+            if homework_id not in self._cancelled:
+                due.append((homework_id, kind))
+            if kind == _FINAL_KIND:
+                self._deadlines.pop(homework_id, None)
+                self._cancelled.discard(homework_id)
+        return due
+
+    async def load(self) -> DeadlineLoadStats:
+        """Заполняет кучу одним потоковым запросом по незавершённым домашкам с дедлайном"""
+        started = time.monotonic()
+        stats = DeadlineLoadStats()
+        now = time.time()
+        async for db in get_session():
+            result = await db.stream(
+                select(Homework.id, Homework.deadline)
+                .where(
+                    Homework.is_done.is_(False),
+                    Homework.is_archived.is_(False),
+                    Homework.deadline.is_not(None),
+                )
+                .execution_options(yield_per=1000)
+            )
+            async for homework_id, deadline in result:
+                stats.scanned += 1
+                stats.queued += self.schedule(homework_id, deadline, now)
+        stats.elapsed = time.monotonic() - started
+        logging.info(
+            f"Deadline reminders loaded: homeworks={stats.scanned} queued={stats.queued} in {stats.elapsed:.2f}s"
+        )
+        return stats
+
+    async def load_changed(self) -> int:
+        """Подхватывает домашки, созданные или изменённые через другие реплики после прошлой проверки.
+        Куча держит домашки всех шардов, фильтр по владельцу — при доставке"""
+        checked_at = datetime.utcnow()
+        queued = 0
+        async for db in get_session():
+            rows = await db.execute(
+                select(Homework.id, Homework.deadline, Homework.is_done, Homework.is_archived)
+                .where(Homework.updated_at >= self._changes.since)
+            )
+            for homework_id, deadline, is_done, is_archived in rows:
+                if is_done or is_archived:
+                    self.cancel(homework_id)
+                else:
+                    queued += self.schedule(homework_id, deadline)
+        self._changes.mark(checked_at)
+        return queued
+
+    async def deliver(self, bot: Bot, due: list[tuple[int, int]]) -> None:
+        """Одним IN (...) загружает домашки и получателей своего шарда и ставит сообщения в outbox"""
+        kinds: dict[int, list[int]] = {}
+        for homework_id, kind in due:
+            kinds.setdefault(homework_id, []).append(kind)
+
+        async for db in get_session():
+            rows = (
+                await db.execute(
+                    select(Homework.id, Homework.subject, User.telegram_id)
+                    .join(User, User.id == Homework.user_id)
+                    .where(
+                        Homework.id.in_(list(kinds)),
+                        Homework.is_done.is_(False),
+                        User.telegram_id.is_not(None),
+                        cluster.shard_clause(User.telegram_id),
+                    )
+                )
+            ).all()
+
+        messages = [
+            OutgoingMessage(telegram_id, f"[{subject}] {REMINDERS[kind][1]}", dedupe_key=f"hw:{homework_id}:{kind}")
+            for homework_id, subject, telegram_id in rows
+            for kind in kinds[homework_id]
+        ]
+        queued = await enqueue_messages(messages)
+        logging.info(f"Deadline reminders: due={len(due)} queued={queued}")
+
+    async def _load_with_retry(self) -> None:
+        """Первичная загрузка: ошибка базы при старте не должна оставить реплику без напоминаний до перезапуска"""
+        delay = 1.0
+        while True:
+            try:
+                await self.load()
+                return
+            except Exception:
+                logging.exception(f"Deadline reminders load failed, retrying in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_sleep)
+
+    async def _run(self, bot: Bot) -> None:
+        assert self._wakeup is not None
+        await self._load_with_retry()
+        loaded_at = changes_at = time.monotonic()
+        while True:
+            # Домашки, созданные и изменённые через другую реплику, подхватываем быстрым опросом по updated_at
+            if cluster.shard_count > 1 and time.monotonic() - changes_at > settings.CLUSTER_CHANGES_SECONDS:
+                try:
+                    await self.load_changed()
+                except Exception:
+                    logging.exception("Deadline reminders change poll failed")
+                changes_at = time.monotonic()
+
+            # Полная сверка с базой — страховка на случай пропущенного опроса
+            if cluster.shard_count > 1 and time.monotonic() - loaded_at > settings.CLUSTER_RESYNC_SECONDS:
+                try:
+                    await self.load()
+                except Exception:
+                    logging.exception("Deadline reminders resync failed")
+                loaded_at = time.monotonic()
+
+            delay = self.max_sleep
+            if self._heap:
+                delay = min(delay, max(0.0, self._heap[0][0] - time.time()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            while due := self.pop_due():
+                try:
+                    await self.deliver(bot, due)
+                except Exception:
+                    logging.exception("Deadline reminders delivery failed")
+
+    def start(self, bot: Bot) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+deadline_engine = DeadlineEngine()
+
+
+def schedule_homework_reminders(homework_id: int, deadline: datetime | None) -> int:
+    return deadline_engine.schedule(homework_id, deadline)
+
+
+def cancel_homework_reminders(homework_id: int) -> None:
+    deadline_engine.cancel(homework_id)
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import NamedTuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.types import InlineKeyboardMarkup
+
+from bot.config import settings
+
+
+class OutgoingMessage(NamedTuple):
+    chat_id: int
+    text: str
+    reply_markup: InlineKeyboardMarkup | None = None
+    # Ключ идемпотентности для outbox: одно и то же уведомление не ставится в очередь дважды
+    dedupe_key: str | None = None
+
+
+class TokenBucket:
+    """Глобальный лимит сообщений в секунду (token bucket)"""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class MessageDispatcher:
+    """Отправка сообщений с ограничением параллельности, лимитами Telegram и повтором после RetryAfter"""
+
+    # Сколько записей о последних отправках по чатам держим до чистки
+    _CHAT_SLOTS_LIMIT = 10_000
+
+    def __init__(
+        self,
+        concurrency: int = settings.DISPATCH_CONCURRENCY,
+        rate_per_sec: float = settings.DISPATCH_RATE_PER_SEC,
+        per_chat_interval: float = settings.DISPATCH_PER_CHAT_INTERVAL,
+        max_retries: int = settings.DISPATCH_MAX_RETRIES,
+    ) -> None:
+        self.concurrency = max(1, concurrency)
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self._bucket = TokenBucket(rate_per_sec)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._chat_next_slot: dict[int, float] = {}
+        self._paused_until = 0.0
+
+    async def _wait_chat_slot(self, chat_id: int) -> None:
+        now = time.monotonic()
+        if len(self._chat_next_slot) > self._CHAT_SLOTS_LIMIT:
+            self._chat_next_slot = {k: v for k, v in self._chat_next_slot.items() if v > now}
+        slot = max(now, self._chat_next_slot.get(chat_id, 0.0))
+        self._chat_next_slot[chat_id] = slot + self.per_chat_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _wait_global_pause(self) -> None:
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def send(self, bot: Bot, message: OutgoingMessage) -> None:
+        """Отправляет одно сообщение; после исчерпания попыток пробрасывает последнюю ошибку"""
+        attempt = 0
+        await self._wait_chat_slot(message.chat_id)
+        async with self._semaphore:
+            while True:
+                await self._wait_global_pause()
+                await self._bucket.acquire()
+                try:
+                    await bot.send_message(message.chat_id, message.text, reply_markup=message.reply_markup)
+                    return
+                except TelegramRetryAfter as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    # Flood control касается всего бота — притормаживаем все отправки
+                    self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                    logging.warning(f"Telegram RetryAfter {e.retry_after}s, chat={message.chat_id}")
+                except (TelegramNetworkError, TelegramServerError):
+                    if attempt >= self.max_retries:
+                        raise
+                    await asyncio.sleep(2 ** attempt)
+                attempt += 1
+
+
+dispatcher = MessageDispatcher()
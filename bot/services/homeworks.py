@@ -7,7 +7,9 @@ from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 
-from bot.database.models import Homework, HomeworkMedia, ScheduleLesson
+from bot.database.models import Homework, ScheduleLesson
+from bot.services.bulk import insert_homework_media
+from bot.services.deadlines import cancel_homework_reminders, schedule_homework_reminders
 
 MediaType = Literal["photo", "video", "document"]
 
@@ -32,11 +34,12 @@ async def add_homework(
     await db.flush()
 
     if media_list:
-        for file_type, file_id in media_list:
-            db.add(HomeworkMedia(homework_id=hw.id, file_type=file_type, file_id=file_id))
+        # Все вложения одним executemany вместо INSERT на каждое через unit of work
+        await insert_homework_media(db, hw.id, media_list)
 
     await db.commit()
     await db.refresh(hw)
+    schedule_homework_reminders(hw.id, hw.deadline)
     return hw
 
 
@@ -60,6 +63,15 @@ async def update_homework_status(db: AsyncSession, homework_id: int, is_done: bo
     await db.execute(stmt)
     await db.commit()
 
+    # Выполненным домашкам напоминания не нужны; при возврате в работу ставим их снова
+    if is_done:
+        cancel_homework_reminders(homework_id)
+    else:
+        deadline = (await db.execute(
+            select(Homework.deadline).where(Homework.id == homework_id, Homework.is_archived.is_(False))
+        )).scalar_one_or_none()
+        schedule_homework_reminders(homework_id, deadline)
+
 
 async def calculate_deadline_from_lesson(db: AsyncSession, lesson_id: int) -> datetime | None:
     """Рассчитывает дедлайн на основе следующего урока"""
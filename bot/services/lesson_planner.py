@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import logging
+
+from aiogram import Bot
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+
+from bot.services.reminder_after_lesson import notify_lesson_slot
+from bot.services.timetable import timetable_index
+
+# За сколько минут до события шлём уведомление
+END_LEAD_MINUTES = 5
+START_LEAD_MINUTES = 15
+
+_MINUTES_PER_DAY = 24 * 60
+_MINUTES_PER_WEEK = 7 * _MINUTES_PER_DAY
+
+
+def _fire_time(day: int, minute: int, lead: int) -> tuple[int, int, int]:
+    """(день 1..7, час, минута) срабатывания; перенос через полночь и конец недели учитывается"""
+    absolute = ((day - 1) * _MINUTES_PER_DAY + minute - lead) % _MINUTES_PER_WEEK
+    fire_day, minute_of_day = divmod(absolute, _MINUTES_PER_DAY)
+    return fire_day + 1, minute_of_day // 60, minute_of_day % 60
+
+
+class LessonEventPlanner:
+    """Одна cron-задача на каждый различный момент (день, время), когда какой-то урок заканчивается или начинается"""
+
+    def __init__(self) -> None:
+        self._bot: Bot | None = None
+        self._scheduler: AsyncIOScheduler | None = None
+        self._jobs: set[str] = set()
+
+    def attach(self, bot: Bot, scheduler: AsyncIOScheduler) -> None:
+        self._bot = bot
+        self._scheduler = scheduler
+        timetable_index.add_listener(self.replan)
+        self.replan()
+
+    def _desired(self) -> dict[str, tuple[str, int, int, int]]:
+        desired: dict[str, tuple[str, int, int, int]] = {}
+        for kind, slots, lead in (
+            ("end", timetable_index.end_slots(), END_LEAD_MINUTES),
+            ("start", timetable_index.start_slots(), START_LEAD_MINUTES),
+        ):
+            for day, minute in slots:
+                desired[f"lesson-{kind}-{day}-{minute}"] = (kind, day, minute, lead)
+        return desired
+
+    def replan(self) -> None:
+        """Сверяет зарегистрированные задачи с текущими слотами индекса: добавляет новые, снимает лишние"""
+        if self._scheduler is None:
+            return
+        desired = self._desired()
+
+        removed = self._jobs - desired.keys()
+        for job_id in removed:
+            job = self._scheduler.get_job(job_id)
+            if job is not None:
+                job.remove()
+
+        added = desired.keys() - self._jobs
+        for job_id in added:
+            kind, day, minute, lead = desired[job_id]
+            fire_day, hour, fire_minute = _fire_time(day, minute, lead)
+            self._scheduler.add_job(
+                notify_lesson_slot,
+                # APScheduler считает дни с 0 = понедельник
+                trigger=CronTrigger(day_of_week=fire_day - 1, hour=hour, minute=fire_minute),
+                args=[self._bot, kind, day, minute],
+                id=job_id,
+                replace_existing=True,
+            )
+
+        self._jobs = set(desired)
+        if added or removed:
+            logging.info(f"Lesson events replanned: jobs={len(self._jobs)} added={len(added)} removed={len(removed)}")
+
+
+lesson_planner = LessonEventPlanner()
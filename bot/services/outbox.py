@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import AsyncIterable, Iterable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.types import InlineKeyboardMarkup
+from sqlalchemy import delete, or_, select, update
+
+from bot.config import settings
+from bot.database.models import NotificationOutbox
+from bot.database.session import get_session
+from bot.services.bulk import insert_rows
+from bot.services.cluster import cluster
+from bot.services.dispatcher import OutgoingMessage, dispatcher
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+
+# Ошибки, при которых повтор бессмысленен: бот заблокирован, чат удалён, некорректное сообщение
+_PERMANENT_ERRORS = (TelegramForbiddenError, TelegramBadRequest)
+
+
+def _row(message: OutgoingMessage, now: datetime) -> dict:
+    return {
+        "chat_id": message.chat_id,
+        "text": message.text,
+        "reply_markup": message.reply_markup.model_dump_json(exclude_none=True) if message.reply_markup else None,
+        "dedupe_key": message.dedupe_key,
+        "status": STATUS_PENDING,
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now,
+    }
+
+
+async def _insert_rows(rows: list[dict]) -> int:
+    async for db in get_session():
+        # Повторная постановка с тем же dedupe_key молча игнорируется
+        queued = await insert_rows(db, NotificationOutbox.__table__, rows, ignore=True)
+        await db.commit()
+        return queued
+    return 0
+
+
+async def enqueue_messages(
+    messages: Iterable[OutgoingMessage] | AsyncIterable[OutgoingMessage],
+    batch_size: int = settings.OUTBOX_BATCH_SIZE,
+) -> int:
+    """Пакетно ставит сообщения в outbox; возвращает число новых записей"""
+    now = datetime.utcnow()
+    queued = 0
+    batch: list[dict] = []
+
+    if isinstance(messages, AsyncIterable):
+        async for message in messages:
+            batch.append(_row(message, now))
+            if len(batch) >= batch_size:
+                queued += await _insert_rows(batch)
+                batch = []
+    else:
+        for message in messages:
+            batch.append(_row(message, now))
+            if len(batch) >= batch_size:
+                queued += await _insert_rows(batch)
+                batch = []
+    if batch:
+        queued += await _insert_rows(batch)
+
+    if queued:
+        outbox_worker.wake()
+    return queued
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.OUTBOX_RETRY_MAX_SECONDS))
+
+
+class OutboxWorker:
+    """Фоновые воркеры: забирают пачки из outbox через SELECT ... FOR UPDATE SKIP LOCKED и доставляют их"""
+
+    # Через сколько считаем «зависшей» запись, которую взяла упавшая реплика
+    CLAIM_TIMEOUT = timedelta(minutes=5)
+
+    def __init__(
+        self,
+        workers: int = settings.OUTBOX_WORKERS,
+        batch_size: int = settings.OUTBOX_BATCH_SIZE,
+        poll_interval: float = settings.OUTBOX_POLL_SECONDS,
+        max_attempts: int = settings.OUTBOX_MAX_ATTEMPTS,
+    ) -> None:
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: asyncio.Event | None = None
+
+    def wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def claim_batch(self) -> list[NotificationOutbox]:
+        now = datetime.utcnow()
+        async for db in get_session():
+            rows = list(
+                (
+                    await db.execute(
+                        select(NotificationOutbox)
+                        .where(
+                            or_(
+                                (NotificationOutbox.status == STATUS_PENDING) & (NotificationOutbox.next_attempt_at <= now),
+                                (NotificationOutbox.status == STATUS_SENDING) & (NotificationOutbox.claimed_at < now - self.CLAIM_TIMEOUT),
+                            )
+                        )
+                        .order_by(NotificationOutbox.id)
+                        .limit(self.batch_size)
+                        .with_for_update(skip_locked=True)
+                    )
+                ).scalars()
+            )
+            if rows:
+                await db.execute(
+                    update(NotificationOutbox)
+                    .where(NotificationOutbox.id.in_([row.id for row in rows]))
+                    .values(status=STATUS_SENDING, claimed_by=cluster.replica_id, claimed_at=now)
+                )
+            await db.commit()
+            return rows
+        return []
+
+    async def deliver(self, bot: Bot, rows: list[NotificationOutbox]) -> None:
+        results = await asyncio.gather(
+            *(
+                dispatcher.send(
+                    bot,
+                    OutgoingMessage(
+                        row.chat_id,
+                        row.text,
+                        InlineKeyboardMarkup.model_validate_json(row.reply_markup) if row.reply_markup else None,
+                    ),
+                )
+                for row in rows
+            ),
+            return_exceptions=True,
+        )
+
+        now = datetime.utcnow()
+        sent_ids = [row.id for row, error in zip(rows, results) if error is None]
+        async for db in get_session():
+            if sent_ids:
+                await db.execute(
+                    update(NotificationOutbox)
+                    .where(NotificationOutbox.id.in_(sent_ids))
+                    .values(status=STATUS_SENT, sent_at=now, attempts=NotificationOutbox.attempts + 1, last_error=None)
+                )
+            for row, error in zip(rows, results):
+                if error is None:
+                    continue
+                attempts = row.attempts + 1
+                permanent = isinstance(error, _PERMANENT_ERRORS) or attempts >= self.max_attempts
+                await db.execute(
+                    update(NotificationOutbox)
+                    .where(NotificationOutbox.id == row.id)
+                    .values(
+                        status=STATUS_FAILED if permanent else STATUS_PENDING,
+                        attempts=attempts,
+                        next_attempt_at=now + _retry_delay(attempts),
+                        last_error=str(error)[:512],
+                    )
+                )
+            await db.commit()
+
+        failed = len(rows) - len(sent_ids)
+        if failed:
+            logging.info(f"Outbox batch: sent={len(sent_ids)} failed={failed}")
+
+    async def _run(self, bot: Bot) -> None:
+        assert self._wakeup is not None
+        while True:
+            try:
+                rows = await self.claim_batch()
+                if rows:
+                    await self.deliver(bot, rows)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Outbox worker failed")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self, bot: Bot) -> None:
+        if not self._tasks:
+            self._wakeup = asyncio.Event()
+            self._tasks = [asyncio.create_task(self._run(bot)) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+outbox_worker = OutboxWorker()
+
+
+async def purge_outbox(older_than: timedelta = timedelta(days=settings.OUTBOX_RETENTION_DAYS)) -> int:
+    """Удаляет доставленные и окончательно неуспешные записи старше срока хранения"""
+    async for db in get_session():
+        result = await db.execute(
+            delete(NotificationOutbox).where(
+                NotificationOutbox.status.in_([STATUS_SENT, STATUS_FAILED]),
+                NotificationOutbox.created_at < datetime.utcnow() - older_than,
+            )
+        )
+        await db.commit()
+        return result.rowcount
+    return 0
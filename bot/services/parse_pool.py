@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, Optional, TypeVar
+
+from bot.config import settings
+from bot.services.schedule_parser import LessonRecord, parse_lesson_records
+
+T = TypeVar("T")
+
+
+@dataclass
+class ParsePoolStats:
+    kind: str
+    workers: int
+    queued: int
+    running: int
+    max_queued: int
+    completed: int
+    failed: int
+    # Среднее время от постановки в очередь до результата
+    avg_seconds: float
+
+
+class ParsePool:
+    """Разбор HTML расписания вне event loop: пул потоков или процессов с метриками очереди"""
+
+    def __init__(self, kind: str = settings.PARSE_POOL_KIND, workers: int = settings.PARSE_POOL_WORKERS) -> None:
+        self.kind = "process" if kind == "process" else "thread"
+        self.workers = max(1, workers)
+        self._executor: Executor | None = None
+        self._queued = 0
+        self._max_queued = 0
+        self._completed = 0
+        self._failed = 0
+        self._busy_seconds = 0.0
+
+    def _ensure_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="schedule-parse")
+        return self._executor
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """Выполняет fn(*args) в пуле; пока все воркеры заняты, задача ждёт в очереди"""
+        executor = self._ensure_executor()
+        self._queued += 1
+        self._max_queued = max(self._max_queued, self._queued)
+        if self._queued == self.workers * 4 + 1:
+            # Предупреждаем один раз при переходе порога, а не на каждую задачу
+            logging.warning(f"Parse pool backlog: queued={self._queued} workers={self.workers}")
+        submitted = time.monotonic()
+        future = asyncio.get_running_loop().run_in_executor(executor, partial(fn, *args))
+        try:
+            result = await future
+        except Exception:
+            self._failed += 1
+            raise
+        else:
+            self._completed += 1
+            return result
+        finally:
+            self._queued -= 1
+            self._busy_seconds += time.monotonic() - submitted
+
+    async def parse_lessons(self, document: str) -> Optional[list[LessonRecord]]:
+        return await self.run(parse_lesson_records, document)
+
+    def stats(self) -> ParsePoolStats:
+        finished = self._completed + self._failed
+        return ParsePoolStats(
+            kind=self.kind,
+            workers=self.workers,
+            # queued считает и выполняющиеся задачи: больше workers — значит есть ожидающие
+            queued=max(0, self._queued - self.workers),
+            running=min(self._queued, self.workers),
+            max_queued=max(0, self._max_queued - self.workers),
+            completed=self._completed,
+            failed=self._failed,
+            avg_seconds=self._busy_seconds / finished if finished else 0.0,
+        )
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+parse_pool = ParsePool()
@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import aiohttp
+from aiogram.types import Message
+
+from bot.config import settings
+
+PORTAL_URL = "https://my.sdu.edu.kz/index.php"
+schedule_data_template = {
+    "mod": "schedule",
+    "ajx": "1",
+    "action": "showSchedule",
+    "year": "2025",
+    "term": "1",
+    "type": "I",
+    "details": "0",
+}
+_LOGIN_LINK_RE = re.compile(r"""class=["']?loginLink""")
+
+# Колбэк, которому сообщается место в очереди к порталу; выставляется обработчиком команды
+QueueListener = Callable[[int], Awaitable[None]]
+portal_queue_listener: ContextVar[QueueListener | None] = ContextVar("portal_queue_listener", default=None)
+
+
+class PortalUnavailable(Exception):
+    """Портал SDU недоступен или перегружен — запрос отклонён сразу, без ожидания"""
+
+    def __init__(self, reason: str, retry_after: float = 0.0) -> None:
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    """AIMD-ограничитель параллельных запросов: лимит растёт на 1 за «окно», пока задержка в норме, и делится пополам при ошибках"""
+
+    def __init__(
+        self,
+        initial: int = settings.PORTAL_CONCURRENCY_INITIAL,
+        min_limit: int = settings.PORTAL_CONCURRENCY_MIN,
+        max_limit: int = settings.PORTAL_CONCURRENCY_MAX,
+        target_latency: float = settings.PORTAL_TARGET_LATENCY_SECONDS,
+        max_queue: int = settings.PORTAL_QUEUE_LIMIT,
+        notify_interval: float = 3.0,
+    ) -> None:
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.target_latency = target_latency
+        self.max_queue = max_queue
+        self.notify_interval = notify_interval
+        self.inflight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _wake(self) -> None:
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(None)
+
+    async def acquire(self, timeout: float, on_position: QueueListener | None = None) -> None:
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise PortalUnavailable("portal queue is full", retry_after=self.target_latency)
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        deadline = loop.time() + timeout
+        last_position = None
+        try:
+            while not waiter.done():
+                position = self._waiters.index(waiter) + 1
+                if on_position is not None and position != last_position:
+                    last_position = position
+                    try:
+                        await on_position(position)
+                    except Exception:
+                        logging.debug("Portal queue listener failed", exc_info=True)
+                    if waiter.done():
+                        break
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise PortalUnavailable("timed out waiting for the portal", retry_after=self.target_latency)
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter), min(remaining, self.notify_interval))
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # Слот уже выдан — возвращаем его следующему в очереди
+                self.inflight -= 1
+                self._wake()
+            else:
+                waiter.cancel()
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self, latency: float, ok: bool) -> None:
+        self.inflight -= 1
+        now = time.monotonic()
+        if ok and latency <= self.target_latency:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        elif now - self._last_decrease > self.target_latency:
+            # Одно уменьшение за окно: пачка одновременных медленных ответов не обрушит лимит до минимума
+            self.limit = max(self.min_limit, self.limit / 2)
+            self._last_decrease = now
+            logging.info(f"Portal limiter: latency={latency:.1f}s ok={ok}, limit -> {int(self.limit)}")
+        self._wake()
+
+    def release_unused(self) -> None:
+        """Возвращает слот без запроса к порталу: лимит не меняется, в нём нет замера задержки"""
+        self.inflight -= 1
+        self._wake()
+
+
+class CircuitBreaker:
+    """Размыкается после серии ошибок подряд; через reset_timeout пропускает один пробный запрос"""
+
+    def __init__(
+        self,
+        failure_threshold: int = settings.PORTAL_BREAKER_FAILURES,
+        reset_timeout: float = settings.PORTAL_BREAKER_RESET_SECONDS,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_inflight = False
+
+    @property
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def rejects(self) -> bool:
+        """Быстрая проверка до постановки в очередь: разомкнут и время пробы ещё не пришло"""
+        return self.state == "open" and self.retry_after > 0
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if self.retry_after > 0:
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probe_inflight:
+                return False
+            self._probe_inflight = True
+        return True
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            logging.info("Portal circuit breaker closed")
+        self.state = "closed"
+        self.failures = 0
+        self._probe_inflight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_inflight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logging.warning(f"Portal circuit breaker opened after {self.failures} failures")
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+    def record_abandoned(self) -> None:
+        """Запрос отменён до результата: счётчики не меняются, пробу можно повторить"""
+        self._probe_inflight = False
+
+
+@contextmanager
+def portal_queue(listener: QueueListener) -> Iterator[None]:
+    """Сообщать listener место в очереди для всех запросов к порталу внутри блока"""
+    token = portal_queue_listener.set(listener)
+    try:
+        yield
+    finally:
+        portal_queue_listener.reset(token)
+
+
+class QueueNotice:
+    """Показывает пользователю место в очереди к порталу: первое уведомление отправляет, дальше редактирует.
+    header — строка над местом в очереди, когда статус уже содержит текст, который нельзя затирать"""
+
+    def __init__(self, message: Message, status: Message | None = None, header: str | None = None) -> None:
+        self.message = message
+        self.status = status
+        self.header = header
+
+    async def __call__(self, position: int) -> None:
+        text = f"⏳ Портал SDU сейчас загружен. Ваше место в очереди: {position}"
+        if self.header:
+            text = f"{self.header}\n{text}"
+        if self.status is None:
+            self.status = await self.message.answer(text)
+        else:
+            await self.status.edit_text(text)
+
+
+def get_current_year_and_term() -> Tuple[int, int]:
+    tz = ZoneInfo(settings.TIMEZONE)
+    now = datetime.now(tz)
+    month = now.month
+    # Academic year starts in September
+    if month >= 9:
+        academic_year_start = now.year
+        term = 1
+    elif 1 <= month <= 6:
+        academic_year_start = now.year - 1
+        term = 2
+    else:
+        # July-August – assume still previous academic year, optional summer term 3
+        academic_year_start = now.year - 1
+        term = 3
+    # API expects the starting year, e.g. 2025 for 2025-2026 term 1/2
+    return academic_year_start, term
+
+
+def schedule_form() -> dict:
+    schedule_datas = schedule_data_template.copy()
+
+    # Устанавливаем текущий год и семестр
+    year, term = get_current_year_and_term()
+    schedule_datas["year"] = str(year)
+    schedule_datas["term"] = str(term)
+    return schedule_datas
+
+
+def looks_logged_out(status: int, html: str) -> bool:
+    """С устаревшими cookies портал отвечает редиректом или страницей входа вместо таблицы"""
+    return 300 <= status < 400 or bool(_LOGIN_LINK_RE.search(html)) or "clTbl" not in html
+
+
+async def request_schedule(session, schedule_datas: dict, allow_redirects: bool = True) -> tuple[int, str]:
+    async with session.post(PORTAL_URL, data=schedule_datas, ssl=False, allow_redirects=allow_redirects) as response:
+        return response.status, await response.text()
+
+
+# Запасной User-Agent, если набор fake_useragent недоступен
+_FALLBACK_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+)
+
+
+def _load_user_agents(size: int) -> list[str]:
+    """Один раз загружает набор fake_useragent и берёт из него пул строк"""
+    try:
+        from fake_useragent import UserAgent
+
+        ua = UserAgent()
+        pool = list({ua.random for _ in range(size * 2)})[:size]
+    except Exception:
+        logging.exception("Failed to load User-Agent pool, using fallback")
+        pool = []
+    return pool or [_FALLBACK_USER_AGENT]
+
+
+class SduPortalClient:
+    """Общий HTTP-клиент портала SDU: один пул соединений на всё приложение, отдельная cookie jar на пользователя"""
+
+    def __init__(
+        self,
+        pool_size: int = settings.PORTAL_POOL_SIZE,
+        keepalive_timeout: float = settings.PORTAL_KEEPALIVE_SECONDS,
+        dns_ttl: int = settings.PORTAL_DNS_TTL_SECONDS,
+        timeout: float = settings.PORTAL_TIMEOUT_SECONDS,
+        ua_pool_size: int = settings.PORTAL_UA_POOL_SIZE,
+    ) -> None:
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.ua_pool_size = ua_pool_size
+        self._connector: aiohttp.TCPConnector | None = None
+        self._user_agents: list[str] = []
+        self.limiter = AdaptiveLimiter()
+        self.breaker = CircuitBreaker()
+        self.queue_timeout = settings.PORTAL_QUEUE_TIMEOUT_SECONDS
+
+    @property
+    def started(self) -> bool:
+        return self._connector is not None and not self._connector.closed
+
+    async def start(self) -> None:
+        if self.started:
+            return
+        if not self._user_agents:
+            self._user_agents = _load_user_agents(self.ua_pool_size)
+        self._connector = aiohttp.TCPConnector(
+            limit=self.pool_size,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_ttl,
+        )
+
+    async def close(self) -> None:
+        if self._connector is not None:
+            await self._connector.close()
+            self._connector = None
+
+    def user_agent(self) -> str:
+        return random.choice(self._user_agents or [_FALLBACK_USER_AGENT])
+
+    @asynccontextmanager
+    async def session(self, cookies: Optional[dict] = None) -> AsyncIterator[aiohttp.ClientSession]:
+        """Лёгкая сессия поверх общего пула: своя cookie jar, соединения переиспользуются между пользователями.
+        Весь блок занимает один слот ограничителя; при разомкнутом предохранителе сразу PortalUnavailable"""
+        if self.breaker.rejects():
+            raise PortalUnavailable("portal circuit breaker is open", retry_after=self.breaker.retry_after)
+        if not self.started:
+            await self.start()
+        await self.limiter.acquire(self.queue_timeout, portal_queue_listener.get())
+        if not self.breaker.allow():
+            self.limiter.release_unused()
+            raise PortalUnavailable("portal circuit breaker is open", retry_after=self.breaker.retry_after)
+        jar = aiohttp.CookieJar()
+        if cookies:
+            jar.update_cookies(cookies)
+        session = aiohttp.ClientSession(
+            connector=self._connector,
+            connector_owner=False,
+            cookie_jar=jar,
+            headers={"User-Agent": self.user_agent()},
+            timeout=self.timeout,
+        )
+        started = time.monotonic()
+        # True — блок завершился, False — любая ошибка; None — отмена, о портале она ничего не говорит
+        ok: Optional[bool] = None
+        try:
+            yield session
+            ok = True
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            ok = False
+            raise
+        finally:
+            await session.close()
+            latency = time.monotonic() - started
+            if ok is None:
+                self.breaker.record_abandoned()
+                self.limiter.release_unused()
+            else:
+                if ok:
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure()
+                self.limiter.release(latency, ok)
+
+
+portal_client = SduPortalClient()
@@ -1,21 +1,157 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Callable, Iterable, Sequence
 from zoneinfo import ZoneInfo
 
 from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from sqlalchemy import select
+from sqlalchemy import Row, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.config import settings
 from bot.database.models import ScheduleLesson, User
 from bot.database.session import get_session
+from bot.services.catalog import LESSON_CATALOG_COLUMNS, with_lesson_catalog
+from bot.services.cluster import cluster
+from bot.services.dispatcher import OutgoingMessage
+from bot.services.outbox import enqueue_messages
+from bot.services.timetable import timetable_index
 
 
 def _now_local() -> datetime:
     return datetime.now(ZoneInfo(settings.TIMEZONE))
 
 
+# Сколько строк забираем из курсора за один раз при сканировании уроков
+LESSON_SCAN_CHUNK = 500
+
+
+def _time_variants(hour: int, minute: int) -> list[str]:
+    """Строки времени 'HH:MM' и 'H:MM' — в базе встречаются оба формата"""
+    return [f"{hour:02d}:{minute:02d}", f"{hour}:{minute:02d}"]
+
+
+_LESSON_COLUMNS = (
+    User.telegram_id,
+    ScheduleLesson.id,
+    ScheduleLesson.course_code,
+    ScheduleLesson.lesson_type,
+    ScheduleLesson.start_time,
+    ScheduleLesson.end_time,
+    *LESSON_CATALOG_COLUMNS,
+)
+
+
+def _lessons_select():
+    """users ⋈ schedule_lessons ⋈ каталог только с нужными для уведомлений колонками"""
+    return with_lesson_catalog(
+        select(*_LESSON_COLUMNS).select_from(ScheduleLesson).join(User, User.id == ScheduleLesson.user_id)
+    )
+
+
+def _lesson_scan_query(day_idx: int, end_times: Iterable[str], start_times: Iterable[str]):
+    """Один запрос на всех пользователей за окно времени"""
+    return (
+        _lessons_select()
+        .where(
+            User.telegram_id.is_not(None),
+            cluster.shard_clause(User.telegram_id),
+            ScheduleLesson.day_of_week == day_idx,
+            or_(
+                ScheduleLesson.end_time.in_(list(end_times)),
+                ScheduleLesson.start_time.in_(list(start_times)),
+            ),
+        )
+        .execution_options(yield_per=LESSON_SCAN_CHUNK)
+    )
+
+
+async def load_lessons_by_ids(db: AsyncSession, lesson_ids: Iterable[int]) -> AsyncIterator[Sequence[Row]]:
+    """Загружает данные для уведомлений по id уроков пачками IN (...)"""
+    ids = sorted(set(lesson_ids))
+    for i in range(0, len(ids), LESSON_SCAN_CHUNK):
+        batch = ids[i:i + LESSON_SCAN_CHUNK]
+        rows = (
+            await db.execute(
+                _lessons_select()
+                .where(ScheduleLesson.id.in_(batch), User.telegram_id.is_not(None))
+            )
+        ).all()
+        yield rows
+
+
+async def iter_lessons_in_window(
+    db: AsyncSession,
+    day_idx: int,
+    end_times: Iterable[str],
+    start_times: Iterable[str],
+) -> AsyncIterator[Sequence[Row]]:
+    """Потоково отдаёт пачки уроков, которые заканчиваются или начинаются в заданное время"""
+    result = await db.stream(_lesson_scan_query(day_idx, end_times, start_times))
+    async for chunk in result.partitions(LESSON_SCAN_CHUNK):
+        yield chunk
+
+
+def _lesson_info(lesson: Row, with_teacher: bool = False) -> str:
+    title = lesson.course_code or lesson.title or "Урок"
+    lesson_info = f"{title}"
+    if lesson.lesson_type:
+        lesson_info += f" ({lesson.lesson_type})"
+    if lesson.room:
+        lesson_info += f" - {lesson.room}"
+    if with_teacher and lesson.teacher:
+        lesson_info += f" - {lesson.teacher}"
+    return lesson_info
+
+
+async def _lesson_messages(
+    chunks: AsyncIterator[Sequence[Row]],
+    is_ending: Callable[[Row], bool],
+    is_starting: Callable[[Row], bool],
+) -> AsyncIterator[OutgoingMessage]:
+    # Дата в ключе: один и тот же урок повторяется каждую неделю
+    today = _now_local().date().isoformat()
+    async for chunk in chunks:
+        for lesson in chunk:
+            if is_ending(lesson):
+                kb = InlineKeyboardMarkup(
+                    inline_keyboard=[
+                        [
+                            InlineKeyboardButton(text="✅ Да", callback_data=f"dz:{lesson.id}:yes"),
+                            InlineKeyboardButton(text="❌ Нет", callback_data=f"dz:{lesson.id}:no"),
+                        ]
+                    ]
+                )
+                yield OutgoingMessage(
+                    lesson.telegram_id,
+                    f"🎓 Занятие '{_lesson_info(lesson)}' скоро закончится (через 5 минут).\n\n📝 Было ли домашнее задание?",
+                    kb,
+                    dedupe_key=f"lesson-end:{today}:{lesson.id}",
+                )
+
+            if is_starting(lesson):
+                yield OutgoingMessage(
+                    lesson.telegram_id,
+                    f"⏰ Напоминание: через 15 минут начинается занятие\n\n"
+                    f"🎓 {_lesson_info(lesson, with_teacher=True)}\n"
+                    f"⏰ Время: {lesson.start_time}-{lesson.end_time}",
+                    dedupe_key=f"lesson-start:{today}:{lesson.id}",
+                )
+
+
+async def _send_lesson_notifications(
+    bot: Bot,
+    chunks: AsyncIterator[Sequence[Row]],
+    is_ending: Callable[[Row], bool],
+    is_starting: Callable[[Row], bool],
+) -> None:
+    queued = await enqueue_messages(_lesson_messages(chunks, is_ending, is_starting))
+    if queued:
+        logging.info(f"Lesson notifications: queued={queued}")
+
+
 async def unified_lesson_check(bot: Bot) -> None:
     """Объединенная проверка: напоминания о домашках + уведомления о следующих уроках"""
     now = _now_local()
@@ -30,97 +166,57 @@ async def unified_lesson_check(bot: Bot) -> None:
     if current_minute != 15:
         return
 
+    # 1. Уроки, заканчивающиеся в XX:20 (через 5 минут)
+    end_minute = current_hour * 60 + 20
+    # 2. Уроки, начинающиеся через 15 минут (±2 минуты для точности)
+    now_minute = current_hour * 60 + current_minute
+    start_minutes = [m for m in range(now_minute + 13, now_minute + 18) if m < 24 * 60]
+
     async for db in get_session():
-        # Получаем всех пользователей с telegram_id
-        users = (await db.execute(select(User).where(User.telegram_id.is_not(None)))).scalars().all()
-
-        for user in users:
-            # Получаем расписание пользователя на сегодня
-            lessons = (
-                await db.execute(
-                    select(ScheduleLesson)
-                    .where(
-                        ScheduleLesson.user_id == user.id,
-                        ScheduleLesson.day_of_week == day_idx,
-                    )
-                )
-            ).scalars().all()
-
-            # 1. ПРОВЕРЯЕМ ДОМАШНИЕ ЗАДАНИЯ (для уроков, заканчивающихся в XX:20)
-            for lesson in lessons:
-                end_time = lesson.end_time  # 'HH:MM'
-
-                try:
-                    lesson_end = datetime.strptime(end_time, "%H:%M").time()
-
-                    # Проверяем, что урок заканчивается в XX:20 через 5 минут
-                    if lesson_end.minute == 20 and lesson_end.hour == current_hour:
-                        kb = InlineKeyboardMarkup(
-                            inline_keyboard=[
-                                [
-                                    InlineKeyboardButton(text="✅ Да", callback_data=f"dz:{lesson.id}:yes"),
-                                    InlineKeyboardButton(text="❌ Нет", callback_data=f"dz:{lesson.id}:no"),
-                                ]
-                            ]
-                        )
-
-                        title = lesson.course_code or lesson.title or "Урок"
-                        lesson_info = f"{title}"
-                        if lesson.lesson_type:
-                            lesson_info += f" ({lesson.lesson_type})"
-                        if lesson.room:
-                            lesson_info += f" - {lesson.room}"
-
-                        try:
-                            await bot.send_message(
-                                user.telegram_id,
-                                f"🎓 Занятие '{lesson_info}' скоро закончится (через 5 минут).\n\n📝 Было ли домашнее задание?",
-                                reply_markup=kb,
-                            )
-                        except Exception as e:
-                            print(f"Ошибка отправки вопроса о домашке пользователю {user.telegram_id}: {e}")
-
-                except ValueError:
-                    continue
-
-            # 2. НАПОМИНАНИЯ О СЛЕДУЮЩИХ УРОКАХ (через 15 минут)
-            next_lesson_time = (now + timedelta(minutes=15)).time()
-            next_lessons = []
-
-            for lesson in lessons:
-                try:
-                    lesson_start = datetime.strptime(lesson.start_time, "%H:%M").time()
-
-                    # Проверяем, начинается ли урок через 15 минут (±2 минуты для точности)
-                    time_diff = abs((datetime.combine(now.date(), lesson_start) -
-                                   datetime.combine(now.date(), next_lesson_time)).total_seconds())
-
-                    if time_diff <= 120:  # В пределах 2 минут
-                        next_lessons.append(lesson)
-
-                except ValueError:
-                    continue
-
-            # Отправляем напоминания о следующих уроках
-            for lesson in next_lessons:
-                title = lesson.course_code or lesson.title or "Урок"
-                lesson_info = f"{title}"
-                if lesson.lesson_type:
-                    lesson_info += f" ({lesson.lesson_type})"
-                if lesson.room:
-                    lesson_info += f" - {lesson.room}"
-                if lesson.teacher:
-                    lesson_info += f" - {lesson.teacher}"
-
-                try:
-                    await bot.send_message(
-                        user.telegram_id,
-                        f"⏰ Напоминание: через 15 минут начинается занятие\n\n"
-                        f"🎓 {lesson_info}\n"
-                        f"⏰ Время: {lesson.start_time}-{lesson.end_time}",
-                    )
-                except Exception as e:
-                    print(f"Ошибка отправки напоминания пользователю {user.telegram_id}: {e}")
+        if timetable_index.ready:
+            # Быстрый путь: берём id уроков из корзин индекса, без полного сканирования и strptime
+            ending_ids = {
+                lesson_id for lesson_id, telegram_id in timetable_index.ending(day_idx, end_minute)
+                if cluster.owns(telegram_id)
+            }
+            starting_ids = {
+                lesson_id for lesson_id, telegram_id in timetable_index.starting(day_idx, *start_minutes)
+                if cluster.owns(telegram_id)
+            }
+            await _send_lesson_notifications(
+                bot,
+                load_lessons_by_ids(db, ending_ids | starting_ids),
+                lambda lesson: lesson.id in ending_ids,
+                lambda lesson: lesson.id in starting_ids,
+            )
+            return
+
+        # Индекс ещё не построен — один запрос на всех пользователей, результаты читаем пачками
+        end_times = set(_time_variants(current_hour, 20))
+        start_times = {t for m in start_minutes for t in _time_variants(m // 60, m % 60)}
+        await _send_lesson_notifications(
+            bot,
+            iter_lessons_in_window(db, day_idx, end_times, start_times),
+            lambda lesson: lesson.end_time in end_times,
+            lambda lesson: lesson.start_time in start_times,
+        )
+
+
+async def notify_lesson_slot(bot: Bot, kind: str, day: int, minute: int) -> None:
+    """Задача планировщика для одного слота: kind='end' — вопрос о домашке, kind='start' — напоминание об уроке"""
+    pairs = timetable_index.ending(day, minute) if kind == "end" else timetable_index.starting(day, minute)
+    # Каждая реплика уведомляет только пользователей своего шарда; импорт через другую реплику
+    # попадает в индекс за один опрос refresh_changed_timetables
+    lesson_ids = {lesson_id for lesson_id, telegram_id in pairs if cluster.owns(telegram_id)}
+    if not lesson_ids:
+        return
+    async for db in get_session():
+        await _send_lesson_notifications(
+            bot,
+            load_lessons_by_ids(db, lesson_ids),
+            lambda lesson: kind == "end",
+            lambda lesson: kind == "start",
+        )
 
 
 # Оставляем старую функцию для совместимости, но делаем её простой заглушкой
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Optional
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
+from bot.services.portal import PortalUnavailable, QueueNotice, portal_queue
+from bot.services.schedule import ImportResult, ScheduleFetchError, refresh_schedule
+
+LOGIN_HEADER = "Вы успешно вошли! ✅"
+STAGE_TEXT = {
+    "start": "⏳ Готовлю загрузку расписания...",
+    "fetch": "🌐 Загружаю расписание с портала SDU...",
+    "parse": "🧩 Разбираю расписание...",
+    "save": "💾 Сохраняю занятия...",
+}
+
+
+def _result_text(result: ImportResult) -> str:
+    if result.imported and not result.changed:
+        return f"Расписание без изменений, занятий: {result.imported}"
+    if result.imported:
+        return f"Импортировано занятий: {result.imported}"
+    return "Занятий не найдено — попробуйте позже командой /parse"
+
+
+async def _edit(status: Message, text: str) -> None:
+    try:
+        await status.edit_text(text)
+    except TelegramBadRequest:
+        # Сообщение удалено или текст не изменился — прогресс не важнее самого импорта
+        logging.debug("Schedule import status edit skipped", exc_info=True)
+
+
+class ScheduleImportTasks:
+    """Фоновый импорт расписания после /login: не больше одной задачи на пользователя, прогресс — правкой статуса"""
+
+    def __init__(self) -> None:
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    def running(self, user_id: int) -> bool:
+        return user_id in self._tasks
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def start(
+        self,
+        user_id: int,
+        status: Message,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        session_payload: Optional[dict] = None,
+    ) -> bool:
+        """False — импорт для пользователя уже идёт, новая задача не создаётся"""
+        if user_id in self._tasks:
+            return False
+        task = asyncio.create_task(self._run(user_id, status, username, password, session_payload))
+        self._tasks[user_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(user_id, None))
+        return True
+
+    async def _run(
+        self,
+        user_id: int,
+        status: Message,
+        username: Optional[str],
+        password: Optional[str],
+        session_payload: Optional[dict],
+    ) -> None:
+        async def progress(stage: str) -> None:
+            await _edit(status, f"{LOGIN_HEADER}\n{STAGE_TEXT[stage]}")
+
+        try:
+            with portal_queue(QueueNotice(status, status, header=LOGIN_HEADER)):
+                # max_age=0: после нового входа всегда загружаем заново, но разделяем уже идущий /parse
+                result = await refresh_schedule(
+                    user_id, username, password, session_payload, max_age=0, progress=progress
+                )
+            await _edit(status, f"{LOGIN_HEADER}\n{_result_text(result)}")
+        except PortalUnavailable:
+            await _edit(status, f"{LOGIN_HEADER}\nПортал SDU сейчас перегружен — обновите расписание позже командой /parse")
+        except ScheduleFetchError:
+            await _edit(status, f"{LOGIN_HEADER}\nНе удалось получить расписание с портала — попробуйте /parse позже")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.exception(f"Background schedule import failed for user {user_id}")
+            await _edit(status, f"{LOGIN_HEADER}\nНе удалось загрузить расписание — попробуйте /parse")
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+
+schedule_imports = ScheduleImportTasks()
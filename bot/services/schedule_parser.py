@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import re
+from typing import Iterable, Iterator, NamedTuple, Optional, Tuple
+
+from lxml import etree
+
+# Первая таблица с классом clTbl — как soup.find('table', {'class': 'clTbl'})
+_TABLE_XPATH = "//table[contains(concat(' ', normalize-space(@class), ' '), ' clTbl ')]"
+_HOUSE_ICON = "images/house.gif"
+_ROOM_RE = re.compile(r"^[A-Z]+\d+")
+# Обычный etree-парсер: без классов lxml.html, поиск класса на каждый узел заметно замедляет разбор
+_PARSER = etree.HTMLParser()
+
+class LessonRecord(NamedTuple):
+    """Одно занятие из расписания — общий формат для импорта HTML и загрузки с портала"""
+    day_of_week: int
+    start_time: str
+    end_time: str
+    course_code: str
+    title: str
+    lesson_type: str
+    section_code: str
+    teacher: str
+    room: str
+
+
+LESSON_TYPES = {"-P]": "Практика", "-N]": "Лекция", "-L]": "Лабораторная"}
+
+
+def _strip_text(el) -> str:
+    """Аналог get_text(strip=True): обрезанные непустые строки потомков без разделителя"""
+    return "".join(map(str.strip, el.itertext()))
+
+
+def _text(el) -> str:
+    return "".join(el.itertext())
+
+
+def _content_count(el) -> int:
+    """Число прямых детей вместе с текстовыми узлами — как len(tag) в BeautifulSoup"""
+    count = 1 if el.text else 0
+    for child in el:
+        count += 2 if child.tail else 1
+    return count
+
+
+def _section(link) -> tuple[str, str]:
+    """Секция вида [03-N] из первого подходящего span после ссылки и тип занятия по её суффиксу"""
+    for sibling in link.itersiblings():
+        if sibling.tag != "span":
+            continue
+        text = _strip_text(sibling)
+        if text.startswith("[") and text.endswith("]"):
+            return text, LESSON_TYPES.get(text[-3:], "")
+    return "", ""
+
+
+def _teacher(cell) -> str:
+    """Последняя строка первого многострочного details; перевод строки может остаться только внутри текстового узла"""
+    for span in cell.iterfind(".//span[@name='details']"):
+        if any("\n" in part.strip() for part in span.itertext()):
+            return _strip_text(span).split("\n")[-1].strip()
+    return ""
+
+
+def _house_room(cell) -> str:
+    """Кабинет из первого span вида E117 после иконки house.gif"""
+    house = cell.find(f".//img[@src='{_HOUSE_ICON}']")
+    if house is None:
+        return ""
+    for sibling in house.itersiblings():
+        if sibling.tag != "span" or sibling.get("name") == "details":
+            continue
+        text = _strip_text(sibling)
+        if text and _ROOM_RE.match(text):
+            return text.replace(" ", "")
+    return ""
+
+
+def _find_table(document: str):
+    if not document or not document.strip():
+        return None
+    root = etree.fromstring(document, _PARSER)
+    if root is None:
+        return None
+    tables = root.xpath(_TABLE_XPATH)
+    return tables[0] if tables else None
+
+
+def parse_time_string(time_str: str) -> Tuple[str, str]:
+    """Парсит строку времени в формате '09:00-10:30' или просто '09:00'"""
+    time_str = time_str.strip()
+
+    # Проверяем формат с диапазоном времени
+    if '-' in time_str:
+        parts = time_str.split('-')
+        if len(parts) == 2:
+            start_time = parts[0].strip()
+            end_time = parts[1].strip()
+            return start_time, end_time
+
+    # Если нет диапазона, предполагаем 50 минута занятие
+    match = re.match(r'(\d{1,2}):(\d{2})', time_str)
+    if match:
+        hour = int(match.group(1))
+        minute = int(match.group(2))
+
+        # Добавляем 0 час 30 минут
+        end_minute = minute + 50
+        end_hour = hour + 0
+        if end_minute >= 60:
+            end_minute -= 60
+            end_hour += 1
+
+        start_time = f"{hour:02d}:{minute:02d}"
+        end_time = f"{end_hour:02d}:{end_minute:02d}"
+        return start_time, end_time
+
+    raise ValueError(f"Could not parse time string: {time_str}")
+
+
+def _row_times(time_cell) -> Optional[Tuple[str, str]]:
+    # Время берём из первого span (начало пары); без span — из текста ячейки вида 08:30-09:20
+    time_span = time_cell.find(".//span")
+    time_text = _text(time_span) if time_span is not None else _strip_text(time_cell)
+    try:
+        return parse_time_string(time_text)
+    except ValueError:
+        if time_span is not None:
+            logging.warning(f"Could not parse time: {time_text}")
+        return None
+
+
+def _iter_records(table) -> Iterator[LessonRecord]:
+    trs = list(table.iter("tr"))
+    # Первая строка — заголовок дней, последние четыре — подвал таблицы
+    for tr in trs[1:len(trs) - 4]:
+        tds = list(tr.iter("td"))
+        if len(tds) < 2:
+            continue
+        times = _row_times(tds[0])
+        if times is None:
+            continue
+        start_time, end_time = times
+
+        for day, cell in enumerate(tds[1:], start=1):
+            if _content_count(cell) == 1:
+                continue
+            links = cell.findall(".//a")
+            if not links:
+                continue
+
+            # Преподаватель и кабинет по house.gif общие для ячейки — считаем один раз
+            teacher = _teacher(cell)
+            house_room = _house_room(cell)
+            titled_spans = None
+
+            for index, link in enumerate(links):
+                section, lesson_type = _section(link)
+                room = house_room
+                if not room:
+                    if titled_spans is None:
+                        titled_spans = cell.findall(".//span[@title]")
+                    location_index = index * 2 + 1
+                    if location_index < len(titled_spans):
+                        room = _strip_text(titled_spans[location_index]).replace(" ", "")
+                yield LessonRecord(
+                    # Столбцы после субботы, как и раньше, попадают в понедельник
+                    day if day <= 6 else 1,
+                    start_time,
+                    end_time,
+                    _text(link).strip(),
+                    link.get("title", ""),
+                    lesson_type,
+                    section,
+                    teacher,
+                    room,
+                )
+
+
+def parse_lesson_records(document: str) -> Optional[list[LessonRecord]]:
+    """Один проход по table.clTbl; None — если таблицы в документе нет"""
+    table = _find_table(document)
+    if table is None:
+        return None
+    return list(_iter_records(table))
+
+
+def lesson_records_digest(records: Iterable[LessonRecord]) -> str:
+    """sha256 нормализованного расписания: порядок строк и пробелы по краям полей не влияют на хэш"""
+    normalized = sorted(tuple(field.strip() if isinstance(field, str) else field for field in record) for record in records)
+    return hashlib.sha256(json.dumps(normalized, ensure_ascii=False).encode("utf-8")).hexdigest()
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import Iterable, Mapping, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.database.models import ScheduleLesson
+from bot.services.bulk import OWN_CATALOG_FIELDS, insert_lessons, lesson_values, update_rows
+from bot.services.schedule_parser import LessonRecord
+from bot.services.timetable import refresh_user_timetable
+
+# Занятие опознаётся по дню, началу, курсу и секции; остальные поля можно обновить на месте
+LessonKey = tuple[int, str, str, str]
+_MUTABLE_FIELDS = ("end_time", "lesson_type", "meeting_id", *OWN_CATALOG_FIELDS)
+
+
+@dataclass
+class ScheduleDiff:
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.inserted or self.updated or self.deleted)
+
+    @property
+    def total(self) -> int:
+        """Занятий в расписании после синхронизации"""
+        return self.inserted + self.updated + self.unchanged
+
+    def __str__(self) -> str:
+        return f"+{self.inserted} ~{self.updated} -{self.deleted} ={self.unchanged}"
+
+
+def lesson_key(day_of_week: int, start_time: str, course_code: str | None, section_code: str | None) -> LessonKey:
+    return day_of_week, start_time.strip(), (course_code or "").strip(), (section_code or "").strip()
+
+
+def _differs(row, values: dict) -> bool:
+    return any((getattr(row, field) or "") != (values[field] or "") for field in _MUTABLE_FIELDS)
+
+
+async def sync_user_lessons(
+    db: AsyncSession,
+    user_id: int,
+    records: Iterable[LessonRecord],
+    meeting_ids: Optional[Mapping[LessonRecord, int]] = None,
+) -> ScheduleDiff:
+    """Сверяет сохранённые занятия с новыми и пишет только разницу одной транзакцией.
+    id совпавших занятий сохраняются, поэтому домашки остаются привязанными к урокам"""
+    meeting_ids = meeting_ids or {}
+    existing: dict[LessonKey, list] = {}
+    rows = await db.execute(
+        select(ScheduleLesson.id, ScheduleLesson.day_of_week, ScheduleLesson.start_time, ScheduleLesson.course_code,
+               ScheduleLesson.section_code, *(getattr(ScheduleLesson, field) for field in _MUTABLE_FIELDS))
+        .where(ScheduleLesson.user_id == user_id)
+        .order_by(ScheduleLesson.id)
+    )
+    for row in rows:
+        existing.setdefault(lesson_key(row.day_of_week, row.start_time, row.course_code, row.section_code), []).append(row)
+
+    diff = ScheduleDiff()
+    inserts, updates = [], []
+    for record in records:
+        # Дубликаты ключа сопоставляются по порядку: первый новый — с первым сохранённым
+        matches = existing.get(lesson_key(record.day_of_week, record.start_time, record.course_code, record.section_code))
+        if not matches:
+            inserts.append(record)
+            continue
+        row = matches.pop(0)
+        values = lesson_values(record, meeting_ids.get(record))
+        if _differs(row, values):
+            updates.append({"_id": row.id, **{field: values[field] for field in _MUTABLE_FIELDS}})
+        else:
+            diff.unchanged += 1
+    stale = [row.id for matches in existing.values() for row in matches]
+
+    if stale:
+        await db.execute(delete(ScheduleLesson).where(ScheduleLesson.id.in_(stale)))
+    await update_rows(db, ScheduleLesson.__table__, updates, _MUTABLE_FIELDS)
+    await insert_lessons(db, user_id, inserts, meeting_ids)
+    await db.commit()
+
+    diff.inserted, diff.updated, diff.deleted = len(inserts), len(updates), len(stale)
+    if diff.changed:
+        await refresh_user_timetable(db, user_id)
+    logging.debug(f"Schedule sync: user {user_id} {diff}")
+    return diff
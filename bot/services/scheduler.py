@@ -1,19 +1,26 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta
+import logging
+from datetime import datetime
+from typing import AsyncIterator
 from zoneinfo import ZoneInfo
 
 from aiogram import Bot
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from apscheduler.triggers.date import DateTrigger
-from sqlalchemy import select
+from apscheduler.triggers.interval import IntervalTrigger
+from sqlalchemy import func, select
 
 from bot.config import settings
 from bot.database.models import User, Homework
-from bot.services.reminder_after_lesson import unified_lesson_check
+from bot.services.lesson_planner import lesson_planner
 from bot.services.archive import move_done_homeworks_to_archive
 from bot.database.session import get_session
+from bot.services.cluster import cluster, leader_only
+from bot.services.dispatcher import OutgoingMessage
+from bot.services.outbox import enqueue_messages, purge_outbox
+from bot.services.session_keeper import refresh_stale_sessions
+from bot.services.timetable import rebuild_timetable_index, refresh_changed_timetables
 
 
 def build_scheduler() -> AsyncIOScheduler:
@@ -21,66 +28,37 @@ def build_scheduler() -> AsyncIOScheduler:
     return AsyncIOScheduler(timezone=tz)
 
 
+def _evening_digest_query():
+    """Число незавершённых домашек по пользователям с telegram_id — одним GROUP BY"""
+    return (
+        select(Homework.user_id, User.telegram_id, func.count(Homework.id))
+        .join(User, User.id == Homework.user_id)
+        .where(
+            Homework.is_done.is_(False),
+            Homework.is_archived.is_(False),
+            User.telegram_id.is_not(None),
+            cluster.shard_clause(User.telegram_id),
+        )
+        .group_by(Homework.user_id, User.telegram_id)
+        .execution_options(yield_per=1000)
+    )
+
+
 async def notify_evening(bot: Bot) -> None:
+    today = datetime.now(ZoneInfo(settings.TIMEZONE)).date().isoformat()
     async for db in get_session():
-        users = (await db.execute(select(User))).scalars().all()
-        for user in users:
-            pending = (await db.execute(
-                select(Homework).where(Homework.user_id == user.id, Homework.is_done.is_(False))
-            )).scalars().all()
-            if pending:
-                try:
-                    await bot.send_message(user.telegram_id, f"Напоминание: у вас {len(pending)} незавершённых домашних. Откройте /homeworks")
-                except Exception:
-                    pass
-
-
-async def schedule_deadline_reminders(bot: Bot, scheduler: AsyncIOScheduler) -> None:
-    tz = ZoneInfo(settings.TIMEZONE)
-    now = datetime.now(tz)
-    async for db in get_session():
-        hws = (await db.execute(select(Homework).where(Homework.is_done.is_(False)))).scalars().all()
-        for hw in hws:
-            if not hw.deadline:
-                continue
-            # -5 hours
-            remind_5h = hw.deadline - timedelta(hours=5)
-            if remind_5h > now:
-                scheduler.add_job(
-                    send_hw_reminder,
-                    trigger=DateTrigger(remind_5h),
-                    args=[bot, hw.id, "Сделай домашку (до дедлайна 5 часов)"],
-                    id=f"hw5h-{hw.id}",
-                    replace_existing=True,
-                )
-            # -10 minutes
-            remind_10m = hw.deadline - timedelta(minutes=10)
-            if remind_10m > now:
-                scheduler.add_job(
-                    send_hw_reminder,
-                    trigger=DateTrigger(remind_10m),
-                    args=[bot, hw.id, "Урок скоро, молодец если сделал"],
-                    id=f"hw10m-{hw.id}",
-                    replace_existing=True,
-                )
+        result = await db.stream(_evening_digest_query())
 
+        async def messages() -> AsyncIterator[OutgoingMessage]:
+            async for _user_id, telegram_id, pending in result:
+                yield OutgoingMessage(
+                    telegram_id,
+                    f"Напоминание: у вас {pending} незавершённых домашних. Откройте /homeworks",
+                    dedupe_key=f"digest:{today}:{telegram_id}",
+                )
 
-async def send_hw_reminder(bot: Bot, homework_id: int, text: str) -> None:
-    async for db in get_session():
-        from sqlalchemy.orm import joinedload
-        hw = (
-            await db.execute(
-                select(Homework)
-                .options(joinedload(Homework.user))
-                .where(Homework.id == homework_id, Homework.is_done.is_(False))
-            )
-        ).scalars().one_or_none()
-        if not hw or not hw.user or not hw.user.telegram_id:
-            return
-        try:
-            await bot.send_message(hw.user.telegram_id, f"[{hw.subject}] {text}")
-        except Exception:
-            pass
+        queued = await enqueue_messages(messages())
+        logging.info(f"Evening digest: queued={queued}")
 
 
 def setup_jobs(bot: Bot, scheduler: AsyncIOScheduler) -> None:
@@ -88,10 +66,39 @@ def setup_jobs(bot: Bot, scheduler: AsyncIOScheduler) -> None:
     scheduler.add_job(notify_evening, trigger=CronTrigger(hour=20, minute=0), args=[bot], id="evening-digest", replace_existing=True)
     # weekly archive job: every Monday at 02:00
     scheduler.add_job(archive_weekly_job, trigger=CronTrigger(day_of_week="mon", hour=2, minute=0), args=[bot], id="weekly-archive", replace_existing=True)
-    # Unified lesson check: homework questions + upcoming lesson reminders at XX:15 every hour
-    scheduler.add_job(unified_lesson_check, trigger=CronTrigger(minute=15), args=[bot], id="unified-lesson-check", replace_existing=True)
+    # Lesson events: homework questions 5 min before a lesson ends, reminders 15 min before it starts
+    lesson_planner.attach(bot, scheduler)
+    # Replicas pick up schedules imported through other replicas
+    scheduler.add_job(resync_timetable_job, trigger=IntervalTrigger(seconds=settings.CLUSTER_RESYNC_SECONDS), id="timetable-resync", replace_existing=True)
+    scheduler.add_job(timetable_changes_job, trigger=IntervalTrigger(seconds=settings.CLUSTER_CHANGES_SECONDS), id="timetable-changes", replace_existing=True)
+    # Portal session keeper: every 20 minutes during off-peak hours
+    scheduler.add_job(session_keeper_job, trigger=CronTrigger(hour=settings.SESSION_KEEPER_HOURS, minute="*/20"), id="session-keeper", replace_existing=True)
+    # Outbox cleanup: every day at 03:30
+    scheduler.add_job(purge_outbox_job, trigger=CronTrigger(hour=3, minute=30), id="outbox-purge", replace_existing=True)
+
+
+async def resync_timetable_job() -> None:
+    if cluster.shard_count > 1:
+        await rebuild_timetable_index()
+
+
+async def timetable_changes_job() -> None:
+    if cluster.shard_count > 1:
+        await refresh_changed_timetables()
+
+
+@leader_only
+async def session_keeper_job() -> None:
+    await refresh_stale_sessions()
+
+
+@leader_only
+async def purge_outbox_job() -> None:
+    removed = await purge_outbox()
+    logging.info(f"Outbox purge: removed={removed}")
 
 
+@leader_only
 async def archive_weekly_job(bot: Bot) -> None:
     async for db in get_session():
         try:
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from bot.config import settings
+from bot.services.portal import looks_logged_out, portal_client, request_schedule, schedule_form
+
+
+async def probe_session(cookies: Optional[dict]) -> bool:
+    """Тот же запрос расписания, что и при загрузке: редирект или страница входа — сессия мертва"""
+    async with portal_client.session(cookies or {}) as session:
+        # Без перехода по редиректу: редирект на страницу входа и есть признак устаревшей сессии
+        status, html = await request_schedule(session, schedule_form(), allow_redirects=False)
+    return not looks_logged_out(status, html)
+
+
+@dataclass
+class SessionState:
+    cookies: Optional[dict]
+    active: bool
+    # time.monotonic() последней проверки на портале; 0 — ещё не проверялась
+    verified_at: float = 0.0
+
+
+class SessionValidityCache:
+    """Кэш активности сессий портала: ответ сразу из памяти, устаревшие записи перепроверяются в фоне пачками"""
+
+    def __init__(
+        self,
+        ttl: float = settings.SESSION_CACHE_TTL_SECONDS,
+        batch_size: int = settings.SESSION_REVALIDATE_BATCH,
+        concurrency: int = settings.SESSION_REVALIDATE_CONCURRENCY,
+        max_entries: int = settings.SESSION_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.concurrency = max(1, concurrency)
+        self.max_entries = max_entries
+        self._entries: OrderedDict[int, SessionState] = OrderedDict()
+        self._pending: OrderedDict[int, None] = OrderedDict()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def is_stale(self, state: SessionState, now: float | None = None) -> bool:
+        now = time.monotonic() if now is None else now
+        return now - state.verified_at > self.ttl
+
+    def lookup(self, user_id: int) -> SessionState | None:
+        """Запись из кэша; устаревшая отдаётся как есть и ставится в очередь на перепроверку"""
+        state = self._entries.get(user_id)
+        if state is None:
+            return None
+        self._entries.move_to_end(user_id)
+        if state.cookies is not None and self.is_stale(state):
+            self.schedule_revalidation(user_id)
+        return state
+
+    def remember(self, user_id: int, cookies: Optional[dict], active: bool, verified: bool = True) -> SessionState:
+        state = SessionState(cookies, active, time.monotonic() if verified else 0.0)
+        self._entries[user_id] = state
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._pending.pop(evicted, None)
+        if not verified:
+            self.schedule_revalidation(user_id)
+        return state
+
+    def forget(self, user_id: int) -> None:
+        self._entries.pop(user_id, None)
+        self._pending.pop(user_id, None)
+
+    def schedule_revalidation(self, user_id: int) -> None:
+        self._pending[user_id] = None
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _revalidate(self, user_id: int, semaphore: asyncio.Semaphore) -> None:
+        state = self._entries.get(user_id)
+        if state is None or state.cookies is None:
+            return
+        async with semaphore:
+            try:
+                active = await probe_session(state.cookies)
+            except Exception as e:
+                # Портал недоступен — оставляем прежний ответ до следующей проверки
+                logging.debug(f"Session revalidation for user {user_id} failed: {e}")
+                active = state.active
+        # Пока шла проверка, пользователь мог войти заново — не затираем свежую запись
+        if self._entries.get(user_id) is state:
+            state.active = active
+            state.verified_at = time.monotonic()
+
+    async def revalidate_pending(self) -> int:
+        """Перепроверяет одну пачку из очереди; возвращает её размер"""
+        batch = []
+        while self._pending and len(batch) < self.batch_size:
+            user_id, _ = self._pending.popitem(last=False)
+            batch.append(user_id)
+        if batch:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            await asyncio.gather(*(self._revalidate(user_id, semaphore) for user_id in batch))
+        return len(batch)
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                while await self.revalidate_pending():
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Session revalidation failed")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            if self._pending:
+                self._wakeup.set()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+session_cache = SessionValidityCache()
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import aiohttp
+from sqlalchemy import bindparam, select, update
+
+from bot.config import settings
+from bot.database.models import User, UserSession
+from bot.database.session import get_session
+from bot.services.auth import decode_cookies, session_expiry, verify_sdu_credentials
+from bot.services.portal import PortalUnavailable
+from bot.services.session_cache import probe_session, session_cache
+
+# Сессии, истекающие в ближайший час, продлеваем заранее
+REFRESH_MARGIN = timedelta(hours=1)
+
+
+@dataclass
+class SessionKeeperReport:
+    scanned: int = 0
+    extended: int = 0
+    relogged: int = 0
+    failed: int = 0
+    skipped: int = 0
+    elapsed: float = 0.0
+
+
+def _stale_sessions_query(now: datetime, limit: int):
+    return (
+        select(UserSession.id, UserSession.user_id, UserSession.cookies_json, User.username, User.password)
+        .join(User, User.id == UserSession.user_id)
+        .where(
+            (UserSession.expires_at.is_(None)) | (UserSession.expires_at < now + REFRESH_MARGIN),
+            User.password.is_not(None),
+            User.password != "temp",
+            User.username.not_like("temp\\_user\\_%"),
+        )
+        # Сначала сессии без срока и самые старые
+        .order_by(UserSession.expires_at.is_not(None), UserSession.expires_at)
+        .limit(limit)
+    )
+
+
+async def _refresh_one(row, semaphore: asyncio.Semaphore) -> tuple[str, dict | None]:
+    """Проверяет сессию по cookies; если она мертва — входит заново. Возвращает (результат, новые cookies).
+    Живой считается только сессия, на которой портал отдал таблицу расписания (см. looks_logged_out)"""
+    cookies = decode_cookies(row.cookies_json)
+    async with semaphore:
+        try:
+            if cookies and await probe_session(cookies):
+                return "extended", None
+            ok, payload = await verify_sdu_credentials(row.username, row.password)
+        except (PortalUnavailable, aiohttp.ClientError, asyncio.TimeoutError):
+            # Портал перегружен или не ответил — это не мёртвая сессия; не трогаем её до следующего запуска
+            return "skipped", None
+        except Exception as e:
+            logging.debug(f"Session keeper: user {row.user_id} refresh failed: {e}")
+            return "failed", None
+    if ok and payload.get("cookies"):
+        return "relogged", payload["cookies"]
+    return "failed", None
+
+
+async def refresh_stale_sessions(
+    limit: int = settings.SESSION_KEEPER_BATCH,
+    concurrency: int = settings.SESSION_KEEPER_CONCURRENCY,
+) -> SessionKeeperReport:
+    """Продлевает сессии портала с истекающим expires_at, пока пользователи спят"""
+    started = time.monotonic()
+    report = SessionKeeperReport()
+    now = datetime.utcnow()
+
+    async for db in get_session():
+        rows = (await db.execute(_stale_sessions_query(now, limit))).all()
+    report.scanned = len(rows)
+    if not rows:
+        return report
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    results = await asyncio.gather(*(_refresh_one(row, semaphore) for row in rows))
+
+    expires_at = session_expiry()
+    relogged, touched = [], []
+    for row, (outcome, cookies) in zip(rows, results):
+        if outcome == "skipped":
+            report.skipped += 1
+        elif outcome == "relogged":
+            report.relogged += 1
+            relogged.append({"_id": row.id, "_cookies": json.dumps(cookies), "_expires": expires_at})
+            session_cache.remember(row.user_id, cookies, active=True)
+        else:
+            # Неудачный вход тоже откладываем на срок сессии, чтобы не долбить портал каждый запуск
+            touched.append({"_id": row.id, "_expires": expires_at})
+            if outcome == "extended":
+                report.extended += 1
+                session_cache.remember(row.user_id, decode_cookies(row.cookies_json), active=True)
+            else:
+                report.failed += 1
+                session_cache.remember(row.user_id, decode_cookies(row.cookies_json), active=False)
+
+    table = UserSession.__table__
+    async for db in get_session():
+        conn = await db.connection()
+        if relogged:
+            await conn.execute(
+                update(table)
+                .where(table.c.id == bindparam("_id"))
+                .values(cookies_json=bindparam("_cookies"), expires_at=bindparam("_expires")),
+                relogged,
+            )
+        if touched:
+            await conn.execute(
+                update(table).where(table.c.id == bindparam("_id")).values(expires_at=bindparam("_expires")),
+                touched,
+            )
+        await db.commit()
+
+    report.elapsed = time.monotonic() - started
+    logging.info(
+        f"Session keeper: scanned={report.scanned} extended={report.extended} "
+        f"relogged={report.relogged} failed={report.failed} skipped={report.skipped} in {report.elapsed:.1f}s"
+    )
+    return report
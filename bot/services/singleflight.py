@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+T = TypeVar("T")
+
+
+def _consume_exception(task: asyncio.Task) -> None:
+    # Если все ожидающие отменились, ошибка задачи не должна уходить в лог как «never retrieved»
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight(Generic[K, T]):
+    """Одна выполняющаяся операция на ключ: параллельные вызовы ждут её и получают тот же результат.
+    Успешный результат ещё freshness секунд отдаётся без повторного запуска; исключение не запоминается,
+    поэтому fn должна сообщать о неудаче исключением, а не «пустым» значением"""
+
+    def __init__(self, freshness: float = 0.0, max_results: int = 10_000) -> None:
+        self.freshness = freshness
+        self.max_results = max_results
+        self._inflight: dict[K, asyncio.Task] = {}
+        self._results: OrderedDict[K, tuple[float, T]] = OrderedDict()
+
+    def in_flight(self, key: K) -> bool:
+        return key in self._inflight
+
+    def forget(self, key: K) -> None:
+        self._results.pop(key, None)
+
+    def _remember(self, key: K, value: T) -> None:
+        self._results[key] = (time.monotonic(), value)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+
+    async def _run(self, key: K, fn: Callable[[], Awaitable[T]]) -> T:
+        try:
+            value = await fn()
+            self._remember(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    async def do(self, key: K, fn: Callable[[], Awaitable[T]], max_age: float | None = None) -> T:
+        """max_age — допустимый возраст готового результата; 0 — всегда свежий запуск (но всё равно общий)"""
+        max_age = self.freshness if max_age is None else max_age
+        cached = self._results.get(key)
+        if cached is not None and max_age > 0 and time.monotonic() - cached[0] <= max_age:
+            return cached[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            # Отдельная задача: отмена первого вызвавшего не обрывает работу для остальных
+            task = asyncio.create_task(self._run(key, fn))
+            task.add_done_callback(_consume_exception)
+            self._inflight[key] = task
+        return await asyncio.shield(task)
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Callable, Iterable, NamedTuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.database.models import ScheduleLesson, ScheduleSnapshot, User
+from bot.database.session import get_session
+from bot.services.cluster import ChangeWatermark
+
+# Ключ корзины: (день недели 1..6, минута от начала суток 0..1439)
+SlotKey = tuple[int, int]
+
+
+class IndexedLesson(NamedTuple):
+    user_id: int
+    telegram_id: int
+    day_of_week: int
+    start_minute: int
+    end_minute: int
+
+
+def time_to_minute(value: str | None) -> int | None:
+    """'09:30' -> 570; None для некорректного значения"""
+    if not value:
+        return None
+    hours, sep, minutes = value.strip().partition(":")
+    if not sep or not hours.isdigit() or not minutes[:2].isdigit():
+        return None
+    hour, minute = int(hours), int(minutes[:2])
+    if hour > 23 or minute > 59:
+        return None
+    return hour * 60 + minute
+
+
+class TimetableIndex:
+    """Индекс расписания в памяти: (день, минута) -> уроки, которые в эту минуту начинаются или заканчиваются"""
+
+    def __init__(self) -> None:
+        self._lessons: dict[int, IndexedLesson] = {}
+        self._by_user: dict[int, set[int]] = {}
+        self._starts: dict[SlotKey, set[int]] = {}
+        self._ends: dict[SlotKey, set[int]] = {}
+        self._listeners: list[Callable[[], None]] = []
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._lessons)
+
+    def add(self, lesson_id: int, user_id: int, telegram_id: int, day: int, start: str, end: str) -> None:
+        """Кладёт урок в корзины начала и конца; урок с неразборчивым временем пропускается"""
+        start_minute = time_to_minute(start)
+        end_minute = time_to_minute(end)
+        if start_minute is None or end_minute is None:
+            return
+        self._lessons[lesson_id] = IndexedLesson(user_id, telegram_id, day, start_minute, end_minute)
+        self._by_user.setdefault(user_id, set()).add(lesson_id)
+        self._starts.setdefault((day, start_minute), set()).add(lesson_id)
+        self._ends.setdefault((day, end_minute), set()).add(lesson_id)
+
+    def _remove(self, lesson_id: int) -> None:
+        entry = self._lessons.pop(lesson_id, None)
+        if entry is None:
+            return
+        for buckets, minute in ((self._starts, entry.start_minute), (self._ends, entry.end_minute)):
+            key = (entry.day_of_week, minute)
+            bucket = buckets.get(key)
+            if bucket is not None:
+                bucket.discard(lesson_id)
+                if not bucket:
+                    del buckets[key]
+
+    def remove_user(self, user_id: int) -> None:
+        for lesson_id in self._by_user.pop(user_id, set()):
+            self._remove(lesson_id)
+
+    def replace_user(
+        self,
+        user_id: int,
+        telegram_id: int | None,
+        lessons: Iterable[tuple[int, int, str, str]],
+    ) -> None:
+        """Заменяет уроки пользователя: lessons — (id, day_of_week, start_time, end_time)"""
+        self.remove_user(user_id)
+        if telegram_id is not None:
+            for lesson_id, day, start, end in lessons:
+                self.add(lesson_id, user_id, telegram_id, day, start, end)
+        self.notify_changed()
+
+    def add_listener(self, callback: Callable[[], None]) -> None:
+        """Подписка на изменения набора слотов (например, для планировщика уведомлений)"""
+        self._listeners.append(callback)
+
+    def notify_changed(self) -> None:
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception:
+                logging.exception("Timetable index listener failed")
+
+    def start_slots(self) -> set[SlotKey]:
+        return set(self._starts)
+
+    def end_slots(self) -> set[SlotKey]:
+        return set(self._ends)
+
+    def _lookup(self, buckets: dict[SlotKey, set[int]], day: int, minutes: Iterable[int]) -> list[tuple[int, int]]:
+        found = []
+        for minute in minutes:
+            for lesson_id in buckets.get((day, minute), ()):
+                found.append((lesson_id, self._lessons[lesson_id].telegram_id))
+        return found
+
+    def starting(self, day: int, *minutes: int) -> list[tuple[int, int]]:
+        """Пары (lesson_id, telegram_id) для уроков, начинающихся в указанные минуты"""
+        return self._lookup(self._starts, day, minutes)
+
+    def ending(self, day: int, *minutes: int) -> list[tuple[int, int]]:
+        """Пары (lesson_id, telegram_id) для уроков, заканчивающихся в указанные минуты"""
+        return self._lookup(self._ends, day, minutes)
+
+    def swap(self, other: "TimetableIndex") -> None:
+        """Атомарно подменяет содержимое индекса заранее построенным"""
+        self._lessons, self._by_user = other._lessons, other._by_user
+        self._starts, self._ends = other._starts, other._ends
+        self.ready = True
+        self.notify_changed()
+
+    def clear(self) -> None:
+        self._lessons.clear()
+        self._by_user.clear()
+        self._starts.clear()
+        self._ends.clear()
+        self.ready = False
+
+
+timetable_index = TimetableIndex()
+
+
+def _index_rows_query():
+    return (
+        select(
+            ScheduleLesson.id,
+            ScheduleLesson.user_id,
+            User.telegram_id,
+            ScheduleLesson.day_of_week,
+            ScheduleLesson.start_time,
+            ScheduleLesson.end_time,
+        )
+        .join(User, User.id == ScheduleLesson.user_id)
+        .where(User.telegram_id.is_not(None))
+    )
+
+
+async def rebuild_timetable_index() -> int:
+    """Строит индекс заново одним запросом по всем урокам; до подмены продолжает работать старый"""
+    fresh = TimetableIndex()
+    async for db in get_session():
+        result = await db.stream(_index_rows_query().execution_options(yield_per=1000))
+        async for lesson_id, user_id, telegram_id, day, start, end in result:
+            fresh.add(lesson_id, user_id, telegram_id, day, start, end)
+    timetable_index.swap(fresh)
+    logging.info(f"Timetable index built: lessons={len(timetable_index)}")
+    return len(timetable_index)
+
+
+async def refresh_user_timetable(db: AsyncSession, user_id: int) -> None:
+    """Инкрементально обновляет индекс после импорта расписания пользователя"""
+    telegram_id = (await db.execute(select(User.telegram_id).where(User.id == user_id))).scalar_one_or_none()
+    rows = (
+        await db.execute(
+            select(
+                ScheduleLesson.id,
+                ScheduleLesson.day_of_week,
+                ScheduleLesson.start_time,
+                ScheduleLesson.end_time,
+            ).where(ScheduleLesson.user_id == user_id)
+        )
+    ).all()
+    timetable_index.replace_user(user_id, telegram_id, rows)
+
+
+# Граница опроса расписаний, импортированных через другие реплики
+_timetable_changes = ChangeWatermark()
+
+
+async def refresh_changed_timetables() -> int:
+    """Перечитывает уроки пользователей, чей снимок расписания обновлён после прошлой проверки:
+    импорт через другую реплику попадает в индекс за один интервал опроса, а не к полной сверке"""
+    checked_at = datetime.utcnow()
+    user_ids: list[int] = []
+    async for db in get_session():
+        user_ids = list(
+            (
+                await db.execute(
+                    select(ScheduleSnapshot.user_id)
+                    .where(ScheduleSnapshot.updated_at >= _timetable_changes.since)
+                    .distinct()
+                )
+            ).scalars()
+        )
+        for user_id in user_ids:
+            await refresh_user_timetable(db, user_id)
+    _timetable_changes.mark(checked_at)
+    if user_ids:
+        logging.info(f"Timetable index: refreshed users changed elsewhere={len(user_ids)}")
+    return len(user_ids)
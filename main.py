@@ -23,8 +23,16 @@ from bot.handlers.reminders import router as reminders_router
 from bot.handlers.archive import router as archive_router
 from bot.handlers.schedule import router as schedule_router
 from bot.handlers.admin import router as admin_router
-from bot.services.scheduler import build_scheduler, setup_jobs, schedule_deadline_reminders
+from bot.services.scheduler import build_scheduler, setup_jobs
+from bot.services.deadlines import deadline_engine
+from bot.services.cluster import cluster
+from bot.services.outbox import outbox_worker
+from bot.services.parse_pool import parse_pool
+from bot.services.portal import portal_client
+from bot.services.schedule_imports import schedule_imports
+from bot.services.session_cache import session_cache
 from bot.services.commands import set_default_commands, set_admin_commands
+from bot.services.timetable import rebuild_timetable_index
 
 
 async def on_startup(bot: Bot) -> None:
@@ -32,6 +40,17 @@ async def on_startup(bot: Bot) -> None:
     # Инициализация базы данных
     await init_models()
 
+    # Индекс расписания в памяти для уведомлений об уроках
+    await rebuild_timetable_index()
+
+    # Общий пул соединений с порталом SDU
+    await portal_client.start()
+    # Фоновая перепроверка сессий портала для /start
+    session_cache.start()
+
+    # Регистрация реплики: лидер выполняет одиночные задачи, рассылки делятся по шардам
+    await cluster.start()
+
     # Установка команд для пользователей и администраторов
     await set_default_commands(bot)
     await set_admin_commands(bot)
@@ -70,18 +89,31 @@ async def main() -> None:
     # Настройка планировщика задач
     scheduler = build_scheduler()
     setup_jobs(bot, scheduler)
-    await schedule_deadline_reminders(bot, scheduler)
     scheduler.start()
-
-    logging.info("🚀 Запуск polling...")
+    # Напоминания о дедлайнах: движок загружает очередь в фоне, не задерживая polling
+    deadline_engine.start(bot)
+    # Доставка уведомлений из outbox
+    outbox_worker.start(bot)
 
     # Запуск бота
     try:
-        await dp.start_polling(bot)
+        if settings.BOT_POLLING:
+            logging.info("🚀 Запуск polling...")
+            await dp.start_polling(bot)
+        else:
+            logging.info("🛰 Реплика без polling: только планировщик и рассылки")
+            await asyncio.Event().wait()
     except KeyboardInterrupt:
         logging.info("⏹️ Бот остановлен пользователем")
     finally:
+        await schedule_imports.stop()
+        await deadline_engine.stop()
+        await outbox_worker.stop()
         scheduler.shutdown()
+        await cluster.stop()
+        await session_cache.stop()
+        await portal_client.close()
+        parse_pool.shutdown()
         logging.info("📴 Планировщик остановлен")
 
 
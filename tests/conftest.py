@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from bot.database import session as db_session
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    """Отдельная SQLite-база на тест вместо настроенной в окружении"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'bot.sqlite'}")
+    monkeypatch.setattr(db_session, "engine", engine)
+    monkeypatch.setattr(db_session, "async_session_maker", async_sessionmaker(engine, expire_on_commit=False))
+
+    async def create_tables() -> None:
+        async with engine.begin() as conn:
+            await conn.run_sync(db_session.Base.metadata.create_all)
+
+    asyncio.run(create_tables())
+    yield engine
+    asyncio.run(engine.dispose())
@@ -0,0 +1,57 @@
+"""Число SQL-команд на успешный /login: record_login должен укладываться в три"""
+from __future__ import annotations
+
+import asyncio
+from contextlib import contextmanager
+from typing import Iterator
+
+from sqlalchemy import event, select
+
+from bot.database import session as db_session
+from bot.database.models import User, UserSession
+from bot.services.auth import record_login
+
+LOGIN_STATEMENTS = 3
+
+
+@contextmanager
+def count_statements(engine) -> Iterator[list[str]]:
+    """Собирает SQL, ушедший в базу внутри блока (COMMIT не считается)"""
+    statements: list[str] = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+
+
+def test_login_paths_take_three_statements(engine):
+    async def scenario() -> tuple[list[int], list, list]:
+        counts = []
+        async for db in db_session.get_session():
+            with count_statements(engine) as statements:
+                await record_login(db, 10, "alice", "pw1", {"cookies": {"a": "1"}})
+            counts.append(len(statements))
+            # Повторный вход тем же аккаунтом
+            with count_statements(engine) as statements:
+                await record_login(db, 10, "alice", "pw2", {"cookies": {"a": "2"}})
+            counts.append(len(statements))
+            # Тот же Telegram входит под другим логином SDU
+            with count_statements(engine) as statements:
+                await record_login(db, 10, "bob", "pw3", {"cookies": {"b": "1"}})
+            counts.append(len(statements))
+
+            users = (await db.execute(select(User.username, User.telegram_id, User.password).order_by(User.id))).all()
+            sessions = (await db.execute(select(UserSession.user_id).order_by(UserSession.user_id))).scalars().all()
+        return counts, users, sessions
+
+    counts, users, sessions = asyncio.run(scenario())
+
+    assert counts == [LOGIN_STATEMENTS] * 3
+    assert [tuple(row) for row in users] == [("alice", None, "pw2"), ("bob", 10, "pw3")]
+    # Одна строка сессии на пользователя
+    assert len(sessions) == len(set(sessions)) == 2
@@ -0,0 +1,90 @@
+"""Импорт расписания: занятия ссылаются на общий каталог, а не копируют название, преподавателя и кабинет"""
+from __future__ import annotations
+
+import asyncio
+
+from sqlalchemy import func, select
+
+from bot.database import session as db_session
+from bot.database.models import Course, CourseSection, ScheduleLesson, SectionMeeting, User
+from bot.services.catalog import load_user_lessons
+from bot.services.schedule import import_lesson_records
+from bot.services.schedule_parser import LessonRecord
+
+LECTURE = LessonRecord(1, "08:30", "09:20", "CSS 101", "Intro", "Лекция", "[01-N]", "T. Teacher", "F101")
+PRACTICE = LessonRecord(2, "10:30", "11:20", "CSS 101", "Intro", "Практика", "[05-P]", "P. Teacher", "F202")
+# Ссылка без кода курса в каталог не попадает: название, преподаватель и кабинет остаются в занятии
+NO_CODE = LessonRecord(3, "12:00", "12:50", "", "Elective", "", "", "N. Teacher", "G301")
+
+
+async def _count(db, model) -> int:
+    return (await db.execute(select(func.count()).select_from(model))).scalar_one()
+
+
+def test_students_share_catalog_rows(engine):
+    async def scenario():
+        async for db in db_session.get_session():
+            db.add_all([User(id=1, username="alice", password="x"), User(id=2, username="bob", password="y")])
+            await db.commit()
+            await import_lesson_records(db, 1, [LECTURE, PRACTICE], 2026, 1)
+            await import_lesson_records(db, 2, [LECTURE], 2026, 1)
+            # Кабинет сменился: правится одна встреча каталога, занятия не переписываются
+            moved = LECTURE._replace(room="F105")
+            result = await import_lesson_records(db, 1, [moved, PRACTICE], 2026, 1)
+            return (
+                result,
+                [await _count(db, model) for model in (Course, CourseSection, SectionMeeting, ScheduleLesson)],
+                (await db.execute(select(ScheduleLesson.meeting_id).order_by(ScheduleLesson.id))).scalars().all(),
+                (await db.execute(select(ScheduleLesson.title, ScheduleLesson.teacher, ScheduleLesson.room))).all(),
+                await load_user_lessons(db, 2),
+            )
+
+    result, counts, meeting_ids, own_fields, bob_lessons = asyncio.run(scenario())
+
+    # Занятия не переписаны, но расписание пользователя изменилось
+    assert result.diff is not None and not result.diff.changed
+    assert result.changed
+    assert counts == [1, 2, 2, 3]
+    # Занятие bob ссылается на ту же встречу, что и у alice
+    assert meeting_ids[0] == meeting_ids[2] and None not in meeting_ids
+    # Связанные занятия не дублируют поля каталога
+    assert {tuple(row) for row in own_fields} == {(None, None, None)}
+    assert [(row.course_code, row.title, row.teacher, row.room) for row in bob_lessons] == [
+        ("CSS 101", "Intro", "T. Teacher", "F105")
+    ]
+
+
+def test_meeting_kept_while_other_students_have_it(engine):
+    async def scenario():
+        async for db in db_session.get_session():
+            db.add_all([User(id=1, username="alice", password="x"), User(id=2, username="bob", password="y")])
+            await db.commit()
+            await import_lesson_records(db, 1, [LECTURE], 2026, 1)
+            await import_lesson_records(db, 2, [LECTURE], 2026, 1)
+            # alice ушла с лекции, у bob она осталась
+            await import_lesson_records(db, 1, [LECTURE._replace(section_code="[02-N]")], 2026, 1)
+            return await load_user_lessons(db, 2)
+
+    bob_lessons = asyncio.run(scenario())
+
+    assert [(row.title, row.room) for row in bob_lessons] == [("Intro", "F101")]
+
+
+def test_unchanged_schedule_without_catalog_sections_is_skipped(engine):
+    async def scenario():
+        async for db in db_session.get_session():
+            db.add(User(id=1, username="alice", password="x"))
+            await db.commit()
+            first = await import_lesson_records(db, 1, [NO_CODE], 2026, 1)
+            second = await import_lesson_records(db, 1, [NO_CODE], 2026, 1)
+            lessons = await load_user_lessons(db, 1)
+            return first, second, lessons
+
+    first, second, lessons = asyncio.run(scenario())
+
+    assert first.changed and first.imported == 1
+    # Совпавший снимок пропускает запись, даже если в каталоге у пользователя нет секций
+    assert not second.changed and second.diff is None
+    assert [(row.day_of_week, row.title, row.teacher, row.room) for row in lessons] == [
+        (3, "Elective", "N. Teacher", "G301")
+    ]